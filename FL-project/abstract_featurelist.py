@@ -1,12 +1,13 @@
 import argparse
 import sys
-import zipfile
 from os import listdir, makedirs
 from os.path import join
 
 from loguru import logger
 
-from analysis.metrics import _load_lines_stmt_map, _SOURCE_CODE_LINES_ZIP_FILE
+from analysis.metrics import get_line_index
+from analysis.manifest import build_manifest, is_up_to_date, write_manifest
+from analysis.parallel import run_tasks
 
 
 def _standardize_statement(s):
@@ -32,36 +33,44 @@ def read_factor_list(factor_list_file):
 
 
 def _key_line2stmt(info_map, pb_id):
-    zf = zipfile.ZipFile(_SOURCE_CODE_LINES_ZIP_FILE)
-    lines_stmt_map = _load_lines_stmt_map(zf, pb_id)
-    result_map = {}
-    for l, info in info_map.items():
-        s = l
-        if l in lines_stmt_map:
-            s = lines_stmt_map[l]
-        result_map[s] = info
-    return result_map
-
-
-def write_factor_list(project_bug_id, top_data_dir, feature_lists_dir):
+    stmts = get_line_index().lines_to_stmts(pb_id, info_map.keys())
+    return dict(zip(stmts, info_map.values()))
+
+
+def write_factor_list(project_bug_id, top_data_dir, feature_lists_dir, *,
+                      streaming=False, coverage_format='packed',
+                      incremental=False):
     from analysis.ranklist import get_spectrum_info, \
-        standardize_gzoltar_statement, all_keys, \
+        aggregate_spectrum_counts, standardize_gzoltar_statement, all_keys, \
         get_or_default
-    from analysis import gzoltar_load_coverage_matrix
+    from analysis import gzoltar_load_coverage, gzoltar_count_spectrum
 
     results_dir = join(top_data_dir, project_bug_id)
-
-    coverage_matrix, statements, test = gzoltar_load_coverage_matrix(
-        results_dir)
-    # initialize for all statements
-    statements = [standardize_gzoltar_statement(s) for s in statements]
-    # get test information
-    fail_map, pass_map, total_failed, total_passed = get_spectrum_info(
-        coverage_matrix, None, statements, test)
+    factors_list_file = join(feature_lists_dir, project_bug_id + '.factors')
+    manifest = None
+    if incremental:
+        manifest = _factor_list_manifest(results_dir)
+        if is_up_to_date(factors_list_file, manifest):
+            logger.info('feature list for {} is up to date', project_bug_id)
+            return
+
+    if streaming:
+        passed, failed, statements, total_passed, total_failed = \
+            gzoltar_count_spectrum(results_dir)
+        statements = [standardize_gzoltar_statement(s) for s in statements]
+        fail_map, pass_map = aggregate_spectrum_counts(
+            statements, passed, failed)
+    else:
+        coverage_matrix, statements, test = gzoltar_load_coverage(
+            results_dir, coverage_format)
+        # initialize for all statements
+        statements = [standardize_gzoltar_statement(s) for s in statements]
+        # get test information
+        fail_map, pass_map, total_failed, total_passed = get_spectrum_info(
+            coverage_matrix, None, statements, test)
 
     # write feature list
     makedirs(feature_lists_dir, exist_ok=True)
-    factors_list_file = join(feature_lists_dir, project_bug_id + '.factors')
     with open(factors_list_file, 'w') as f:
         f.write(','.join([
             'statement', 'total_passed', 'total_failed',
@@ -77,6 +86,27 @@ def write_factor_list(project_bug_id, top_data_dir, feature_lists_dir):
                 '%s#%s' % s, total_passed, total_failed,
                 passed, failed,
             ])) + '\n')
+    if manifest:
+        write_manifest(factors_list_file, manifest)
+
+
+def _factor_list_manifest(results_dir):
+    import analysis.coverage
+    import analysis.gzoltar
+    from analysis.ranklist import get_spectrum_info, \
+        aggregate_spectrum_counts, standardize_gzoltar_statement
+    return build_manifest(
+        [join(results_dir, 'matrix'), join(results_dir, 'spectra')],
+        code=(write_factor_list, analysis.gzoltar, analysis.coverage,
+              get_spectrum_info, aggregate_spectrum_counts,
+              standardize_gzoltar_statement))
+
+
+def _write_factor_list(project_bug_id, top_data_dir, feature_lists_dir,
+                       streaming, coverage_format, incremental):
+    write_factor_list(project_bug_id, top_data_dir, feature_lists_dir,
+                      streaming=streaming, coverage_format=coverage_format,
+                      incremental=incremental)
 
 
 def main(argv):
@@ -85,13 +115,36 @@ def main(argv):
                         metavar='top-data-dir', dest='top_data_dir')
     parser.add_argument('-o', required=True,
                         metavar='feature-list-dir', dest='feature_lists_dir')
+    parser.add_argument('-s', '--streaming', action='store_true',
+                        default=False)
+    parser.add_argument('-c', '--cache', action='store_const', const='cached',
+                        dest='coverage_format', default='packed')
+    parser.add_argument('--sparse', action='store_const', const='sparse',
+                        dest='coverage_format')
+    parser.add_argument('-j', metavar='jobs', dest='jobs', type=int,
+                        default=1)
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        default=False)
     args = parser.parse_args(argv[1:])
     top_data_dir = args.top_data_dir
     feature_lists_dir = args.feature_lists_dir
     project_bug_ids = [x for x in listdir(top_data_dir) if '-' in x]
-    for project_bug_id in project_bug_ids:
-        logger.info('write feature list for ' + project_bug_id)
-        write_factor_list(project_bug_id, top_data_dir, feature_lists_dir)
+    tasks = [(project_bug_id, top_data_dir, feature_lists_dir,
+              args.streaming, args.coverage_format, args.incremental)
+             for project_bug_id in project_bug_ids]
+    failed_bugs = []
+    for i, ((project_bug_id, *_), succeeded, result) in enumerate(
+            run_tasks(_write_factor_list, tasks, jobs=args.jobs)):
+        if succeeded:
+            logger.info('[{}/{}] write feature list for {}',
+                        i + 1, len(tasks), project_bug_id)
+        else:
+            logger.error('[{}/{}] failed feature list for {}:\n{}',
+                         i + 1, len(tasks), project_bug_id, result)
+            failed_bugs.append(project_bug_id)
+    if failed_bugs:
+        logger.error('failed bugs: {}', ' '.join(sorted(failed_bugs)))
+        sys.exit(-1)
 
 
 if __name__ == '__main__':
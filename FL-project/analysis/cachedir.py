@@ -0,0 +1,43 @@
+import json
+from os import makedirs, remove, replace
+from os.path import join, exists
+
+import numpy as np
+
+# every cache directory is committed by its meta file
+_META_FILE_NAME = 'meta.json'
+
+
+def load_cache_meta(cache_dir, version):
+    # meta of a committed cache of `version`, None if there is none
+    meta_file = join(cache_dir, _META_FILE_NAME)
+    if not exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if meta.get('version') != version:
+        return None
+    return meta
+
+
+def _replace_file(file, write, mode):
+    # files are replaced rather than rewritten, so that memory maps of the
+    # old ones, in this or another process, keep seeing the old contents
+    with open(file + '.tmp', mode) as f:
+        write(f)
+    replace(file + '.tmp', file)
+
+
+def write_cache(cache_dir, meta, *, arrays=None, texts=None):
+    # write {name: array} as name.npy and {name: text} as name, the meta is
+    # removed first and written last to commit the cache
+    makedirs(cache_dir, exist_ok=True)
+    meta_file = join(cache_dir, _META_FILE_NAME)
+    if exists(meta_file):
+        remove(meta_file)
+    for name, array in (arrays or {}).items():
+        _replace_file(join(cache_dir, name + '.npy'),
+                      lambda f: np.save(f, array), 'wb')
+    for name, text in (texts or {}).items():
+        _replace_file(join(cache_dir, name), lambda f: f.write(text), 'w')
+    _replace_file(meta_file, lambda f: json.dump(meta, f), 'w')
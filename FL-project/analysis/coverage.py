@@ -0,0 +1,77 @@
+import numpy as np
+
+# number of set bits of every byte value
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)],
+                           dtype=np.uint8)
+
+# number of packed test rows processed at once when counting
+_PACKED_BLOCK_ROWS = 4096
+
+
+class PackedCoverage:
+    # coverage matrix with tests packed 8-per-byte along the first axis,
+    # i.e. bits[i, s] holds tests [8i, 8i + 8) of statement s
+    def __init__(self, bits, n_tests):
+        self.bits = bits
+        self.n_tests = n_tests
+
+    @property
+    def shape(self):
+        return self.n_tests, self.bits.shape[1]
+
+    @staticmethod
+    def from_dense(coverage):
+        coverage = np.asarray(coverage)
+        return PackedCoverage(np.packbits(coverage.astype(bool), axis=0),
+                              coverage.shape[0])
+
+    def to_dense(self, dtype=np.uint8):
+        return np.unpackbits(self.bits, axis=0)[:self.n_tests].astype(dtype)
+
+
+def popcount_columns(bits, mask):
+    # count set bits of each column of `bits` after and-ing with `mask`
+    counts = np.zeros(bits.shape[1], dtype=np.int64)
+    for i in range(0, bits.shape[0], _PACKED_BLOCK_ROWS):
+        block = bits[i:i + _PACKED_BLOCK_ROWS] & \
+                mask[i:i + _PACKED_BLOCK_ROWS, np.newaxis]
+        counts += _POPCOUNT_TABLE[block].sum(axis=0, dtype=np.int64)
+    return counts
+
+
+def is_sparse(coverage):
+    # whether coverage is a scipy.sparse matrix, without importing scipy,
+    # which is slow to import and only needed for sparse coverage
+    return hasattr(coverage, 'tocsr')
+
+
+def count_spectrum(coverage, outcomes):
+    # return per-statement passed and failed counts, together with total
+    # passed and failed tests
+    outcomes = np.asarray(outcomes, dtype=bool)
+    total_passed = int(outcomes.sum())
+    total_failed = len(outcomes) - total_passed
+    if isinstance(coverage, PackedCoverage):
+        passed = popcount_columns(coverage.bits, np.packbits(outcomes))
+        failed = popcount_columns(coverage.bits, np.packbits(~outcomes))
+    elif is_sparse(coverage):
+        passed = np.asarray(coverage.T.dot(outcomes.astype(np.int64))).ravel()
+        failed = np.asarray(
+            coverage.T.dot((~outcomes).astype(np.int64))).ravel()
+    else:
+        coverage = np.asarray(coverage)
+        passed = coverage[outcomes].sum(axis=0, dtype=np.int64)
+        failed = coverage[~outcomes].sum(axis=0, dtype=np.int64)
+    return passed, failed, total_passed, total_failed
+
+
+def coverage_rows(coverage, indices):
+    # dense 0/1 rows of the given tests, whatever the representation is
+    if isinstance(coverage, PackedCoverage):
+        indices = np.asarray(indices, dtype=np.int64)
+        bits = coverage.bits[indices // 8]
+        shifts = (7 - indices % 8).astype(np.uint8)
+        return (bits >> shifts[:, np.newaxis]) & np.uint8(1)
+    if is_sparse(coverage):
+        return coverage[list(indices)].toarray()
+    return np.asarray([coverage[i] for i in indices])
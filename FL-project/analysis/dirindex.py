@@ -0,0 +1,23 @@
+from os import scandir
+from os.path import split
+
+
+class DirectoryIndex:
+    # answer whether files exist from one scandir per directory, taken on
+    # the first lookup in the directory and kept for the lifetime of the
+    # index, instead of a stat per file
+    def __init__(self):
+        self._names = {}
+
+    def names(self, directory):
+        if directory not in self._names:
+            try:
+                with scandir(directory) as entries:
+                    self._names[directory] = frozenset(e.name for e in entries)
+            except (FileNotFoundError, NotADirectoryError):
+                self._names[directory] = frozenset()
+        return self._names[directory]
+
+    def exists(self, path):
+        directory, name = split(path)
+        return name in self.names(directory)
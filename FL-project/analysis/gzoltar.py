@@ -1,6 +1,15 @@
-import collections
+import collections.abc
+from itertools import islice
+from os import stat
 from os.path import exists, join
 
+import numpy as np
+from loguru import logger
+
+from .cachedir import load_cache_meta, write_cache
+from .coverage import PackedCoverage, count_spectrum, coverage_rows, \
+    is_sparse
+
 
 def gzoltar_load_test_list(gzoltar_dir):
     tests_file = join(gzoltar_dir, 'tests')
@@ -18,78 +27,310 @@ def gzoltar_load_test_list(gzoltar_dir):
     return tests
 
 
-def gzoltar_load_coverage_matrix(gzoltar_dir):
-    if not exists(gzoltar_dir):
-        return None, None, None
-    matrix_file, stmt_file = \
-        join(gzoltar_dir, 'matrix'), join(gzoltar_dir, 'spectra')
-
-    if not (exists(matrix_file) and exists(stmt_file)):
-        return None, None, None
-
+def _read_statements(stmt_file):
     # remove first line "Component"
-    statements = [
+    return [
         l.rstrip('\n')
         for l in
         open(stmt_file).readlines()[:]
     ]
-    # remove first line "Test,Pass-Fail,Runtime(ns),stacktrace"
-    # tests = [
-    #     (x[0].replace('#', '::'), x[1] == 'PASS')
-    #     for x in
-    #     [
-    #         l.rstrip('\n').split(',', maxsplit=3)
-    #         for l in
-    #         open(tests_file).readlines()[1:]
-    #     ]
-    # ]
-    # load matrix
-    # coverage_matrix = [
-    #     [int(x) for x in l.rstrip('\n').split(' ')[:-1]]
-    #     for l in
-    #     open(matrix_file).readlines()
-    # ]
-    # tests = [
-    #     ('dummy', l[-1] == '+')
-    #     for l in open(matrix_file).readlines()
-    # ]
-    coverage_matrix, tests = [], []
-    with open(matrix_file) as f:
-        for l in f.readlines():
-            v = l.rstrip('\n').split(' ')
-            coverage_matrix.append(list(map(int, v[:-1])))
-            tests.append(('dummy', v[-1] == '+'))
 
+
+def _parse_matrix_rows(data, dtype):
+    # each row of a gzoltar matrix looks like "0 1 ... 1 +\n", i.e. every
+    # row has the same width when all rows cover the same statements, so
+    # the whole file can be viewed as a 2-d byte array without splitting
+    if data and not data.endswith(b'\n'):
+        data += b'\n'
+    if not data:
+        return np.zeros((0, 0), dtype=dtype), np.zeros(0, dtype=bool)
+    width = data.index(b'\n') + 1
+    if width < 3 or len(data) % width != 0:
+        return None
+    rows = np.frombuffer(data, dtype=np.uint8).reshape(-1, width)
+    if not (rows[:, -1] == ord('\n')).all() \
+            or not (rows[:, 1:-1:2] == ord(' ')).all():
+        return None
+    values = rows[:, 0:-2:2] - np.uint8(ord('0'))
+    if values.size and values.max() > 1:
+        return None
+    outcomes = rows[:, -2] == ord('+')
+    return np.ascontiguousarray(values, dtype=dtype), outcomes
+
+
+def _parse_matrix(data, dtype):
+    parsed = _parse_matrix_rows(data, dtype)
+    if parsed is None:
+        # irregular rows, fall back to parse line by line
+        rows, outcomes = [], []
+        for l in data.decode().splitlines():
+            v = l.split(' ')
+            rows.append(list(map(int, v[:-1])))
+            outcomes.append(v[-1] == '+')
+        parsed = np.array(rows, dtype=dtype), np.array(outcomes, dtype=bool)
+    return parsed
+
+
+def _gzoltar_files(gzoltar_dir):
+    # (matrix file, spectra file) of a gzoltar dir, None if either is missing
+    matrix_file, stmt_file = \
+        join(gzoltar_dir, 'matrix'), join(gzoltar_dir, 'spectra')
+    if not (exists(matrix_file) and exists(stmt_file)):
+        return None
+    return matrix_file, stmt_file
+
+
+def gzoltar_load_coverage_array(gzoltar_dir, *, dtype=np.uint8, pack=False):
+    # load coverage matrix as a (tests x statements) array, with statements
+    # and a boolean vector telling whether each test passed. If `pack`,
+    # the coverage is returned as a bit-packed PackedCoverage instead
+    files = _gzoltar_files(gzoltar_dir)
+    if not files:
+        return None, None, None
+    matrix_file, stmt_file = files
+
+    statements = _read_statements(stmt_file)
+    with open(matrix_file, 'rb') as f:
+        data = f.read()
+    coverage, outcomes = _parse_matrix(data, dtype)
+    if coverage.shape[0] == 0:
+        coverage = np.zeros((0, len(statements)), dtype=dtype)
+    if pack:
+        coverage = PackedCoverage.from_dense(coverage)
+    return coverage, statements, outcomes
+
+
+def gzoltar_load_coverage_matrix(gzoltar_dir):
+    coverage, statements, outcomes = gzoltar_load_coverage_array(gzoltar_dir)
+    if coverage is None:
+        return None, None, None
+    coverage_matrix = coverage.tolist()
+    tests = [('dummy', bool(o)) for o in outcomes]
     return coverage_matrix, statements, tests
 
 
-def _spectra_distance(ra, rb):
-    assert len(ra) == len(rb)
-    return sum([abs(ra[i] - rb[i]) for i in range(len(ra))])
+_CACHE_DIR_NAME = '.spectra-cache'
+_CACHE_VERSION = 1
+
+
+def _source_signature(*files):
+    sig = []
+    for file in files:
+        st = stat(file)
+        sig.append([st.st_size, st.st_mtime_ns])
+    return sig
+
+
+def _load_cache(cache_dir, signature):
+    meta = load_cache_meta(cache_dir, _CACHE_VERSION)
+    if not meta or meta.get('sources') != signature:
+        return None
+    bits = np.load(join(cache_dir, 'coverage.npy'), mmap_mode='r')
+    outcomes = np.load(join(cache_dir, 'outcomes.npy'), mmap_mode='r')
+    with open(join(cache_dir, 'statements')) as f:
+        statements = f.read().split('\n')[:meta['statements']]
+    return PackedCoverage(bits, meta['tests']), statements, outcomes
+
+
+def _write_cache(cache_dir, signature, coverage, statements, outcomes):
+    write_cache(cache_dir, {
+        'version': _CACHE_VERSION,
+        'sources': signature,
+        'tests': coverage.n_tests,
+        'statements': len(statements),
+    }, arrays={'coverage': coverage.bits, 'outcomes': outcomes},
+        texts={'statements': '\n'.join(statements)})
+
+
+def gzoltar_load_coverage_cached(gzoltar_dir):
+    # load bit-packed coverage through a memory-mapped binary cache kept
+    # under `gzoltar_dir`, which is rebuilt once matrix or spectra changed
+    files = _gzoltar_files(gzoltar_dir)
+    if not files:
+        return None, None, None
+    matrix_file, stmt_file = files
+
+    cache_dir = join(gzoltar_dir, _CACHE_DIR_NAME)
+    signature = _source_signature(matrix_file, stmt_file)
+    try:
+        cached = _load_cache(cache_dir, signature)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning('broken spectra cache {}: {}', cache_dir, e)
+        cached = None
+    if cached:
+        return cached
+
+    coverage, statements, outcomes = gzoltar_load_coverage_array(
+        gzoltar_dir, pack=True)
+    try:
+        _write_cache(cache_dir, signature, coverage, statements, outcomes)
+    except OSError as e:
+        logger.warning('failed to write spectra cache {}: {}', cache_dir, e)
+    return coverage, statements, outcomes
+
+
+def gzoltar_count_spectrum(gzoltar_dir, *, chunk_rows=1024):
+    # stream the coverage matrix `chunk_rows` tests at a time and reduce it
+    # to per-statement passed/failed counts, so that the whole matrix never
+    # resides in memory
+    files = _gzoltar_files(gzoltar_dir)
+    if not files:
+        return None, None, None, None, None
+    matrix_file, stmt_file = files
+
+    statements = _read_statements(stmt_file)
+    passed = np.zeros(len(statements), dtype=np.int64)
+    failed = np.zeros(len(statements), dtype=np.int64)
+    total_passed, total_failed = 0, 0
+    with open(matrix_file, 'rb') as f:
+        while True:
+            chunk = b''.join(islice(f, chunk_rows))
+            if not chunk:
+                break
+            coverage, outcomes = _parse_matrix(chunk, np.uint8)
+            p, f_, tp, tf = count_spectrum(coverage, outcomes)
+            passed[:len(p)] += p
+            failed[:len(f_)] += f_
+            total_passed += tp
+            total_failed += tf
+    return passed, failed, statements, total_passed, total_failed
+
+
+def gzoltar_load_coverage_sparse(gzoltar_dir, *, chunk_rows=1024):
+    # load coverage matrix as a scipy.sparse csr matrix, the matrix file is
+    # parsed in chunks so that the dense form of only one chunk is in memory
+    from scipy.sparse import csr_matrix, vstack
+    files = _gzoltar_files(gzoltar_dir)
+    if not files:
+        return None, None, None
+    matrix_file, stmt_file = files
+
+    statements = _read_statements(stmt_file)
+    blocks, outcomes_list = [], []
+    with open(matrix_file, 'rb') as f:
+        while True:
+            chunk = b''.join(islice(f, chunk_rows))
+            if not chunk:
+                break
+            coverage, outcomes = _parse_matrix(chunk, np.uint8)
+            blocks.append(csr_matrix(coverage))
+            outcomes_list.append(outcomes)
+    if not blocks:
+        return csr_matrix((0, len(statements)), dtype=np.uint8), statements, \
+               np.zeros(0, dtype=bool)
+    return vstack(blocks, format='csr'), statements, \
+           np.concatenate(outcomes_list)
+
+
+def gzoltar_load_coverage(gzoltar_dir, coverage_format='packed'):
+    if coverage_format == 'dense':
+        return gzoltar_load_coverage_array(gzoltar_dir)
+    elif coverage_format == 'packed':
+        return gzoltar_load_coverage_array(gzoltar_dir, pack=True)
+    elif coverage_format == 'cached':
+        return gzoltar_load_coverage_cached(gzoltar_dir)
+    elif coverage_format == 'sparse':
+        return gzoltar_load_coverage_sparse(gzoltar_dir)
+    raise ValueError('unrecognized coverage format ' + coverage_format)
+
+
+# bytes of the block of coverage rows compared at once by distance analysis
+_DISTANCE_BLOCK_BYTES = 64 << 20
+
+
+def _row_count(coverage):
+    return coverage.shape[0] if hasattr(coverage, 'shape') else len(coverage)
+
+
+def _spectra_distance_blocks(coverage_matrix, target_rows, *,
+                             block_rows=None):
+    # yield (start, distances of targets to tests [start, start + block)),
+    # as rows are 0/1 vectors, the manhattan distance equals the hamming
+    # distance |a| + |b| - 2 a.b. Counts are exact in float32 up to 2 ** 24
+    # statements, and sparse coverage is multiplied without densifying it
+    targets = np.asarray(target_rows, dtype=np.float32)
+    target_sums = targets.sum(axis=1)
+    n_rows = _row_count(coverage_matrix)
+    if block_rows is None:
+        block_rows = max(1, _DISTANCE_BLOCK_BYTES //
+                         (targets.dtype.itemsize * max(1, targets.shape[1])))
+    for start in range(0, n_rows, block_rows):
+        end = min(start + block_rows, n_rows)
+        if is_sparse(coverage_matrix):
+            block = coverage_matrix[start:end]
+            block_sums = np.asarray(block.sum(axis=1)).ravel()
+            dots = block.dot(targets.T).T
+        else:
+            block = np.asarray(coverage_rows(coverage_matrix, range(
+                start, end)), dtype=np.float32)
+            block_sums = block.sum(axis=1)
+            dots = targets.dot(block.T)
+        distances = target_sums[:, np.newaxis] + block_sums - 2 * dots
+        yield start, distances.astype(np.int64)
+
+
+def _test_indices(tests, target_tests):
+    index_map = {}
+    for i, t in enumerate(tests):
+        index_map.setdefault(t, i)
+    if any(t not in index_map for t in target_tests):
+        raise ValueError('all target tests should have been in tests')
+    return [index_map[t] for t in target_tests]
 
 
 def analysis_tell_spectra_distance(coverage_matrix, tests, target_tests, *,
                                    minimum=True):
-    if not minimum and not isinstance(target_tests, collections.Sequence):
+    if not minimum and not isinstance(target_tests, collections.abc.Sequence):
         raise ValueError('target tests must be a sequence')
 
-    if not minimum and any([t not in tests for t in target_tests]):
-        raise ValueError('all target tests should have been in tests')
-
-    target_spectra_rows = [coverage_matrix[tests.index(t)] for t in
-                           target_tests]
+    target_indices = _test_indices(tests, target_tests)
+    target_spectra_rows = coverage_rows(coverage_matrix, target_indices)
 
     # if not minimum, return the full distance matrix, otherwise return
     # a vector of minimum matrix
     if not minimum:
-        distance_matrix = [
-            [_spectra_distance(r, rb) for rb in coverage_matrix]
-            for r in target_spectra_rows
-        ]
-        return distance_matrix
+        distance_matrix = np.zeros(
+            (len(target_indices), _row_count(coverage_matrix)),
+            dtype=np.int64)
+        for start, distances in _spectra_distance_blocks(
+                coverage_matrix, target_spectra_rows):
+            distance_matrix[:, start:start + distances.shape[1]] = distances
+        return distance_matrix.tolist()
     else:
-        min_distance_vector = [
-            min([_spectra_distance(r, rb) for rb in target_spectra_rows])
-            for r in coverage_matrix
-        ]
+        min_distance_vector = []
+        for _, distances in _spectra_distance_blocks(
+                coverage_matrix, target_spectra_rows):
+            min_distance_vector.extend(distances.min(axis=0).tolist())
         return min_distance_vector
+
+
+def analysis_nearest_tests(coverage_matrix, tests, query_tests, k=10, *,
+                           exclude_self=True):
+    # for every query test, return its k nearest tests by spectra distance
+    # as [(test, distance)...], ties are broken by the order of tests
+    query_indices = _test_indices(tests, query_tests)
+    query_rows = coverage_rows(coverage_matrix, query_indices)
+    best_distances = np.zeros((len(query_indices), 0), dtype=np.int64)
+    best_indices = np.zeros((len(query_indices), 0), dtype=np.int64)
+    for start, distances in _spectra_distance_blocks(coverage_matrix,
+                                                     query_rows):
+        indices = np.broadcast_to(
+            np.arange(start, start + distances.shape[1]), distances.shape)
+        if exclude_self:
+            distances = np.where(
+                indices == np.asarray(query_indices)[:, np.newaxis],
+                np.iinfo(np.int64).max, distances)
+        best_distances = np.hstack([best_distances, distances])
+        best_indices = np.hstack([best_indices, indices])
+        if best_distances.shape[1] > k:
+            # order by (distance, index) and keep the first k
+            order = np.lexsort((best_indices, best_distances), axis=1)[:, :k]
+            best_distances = np.take_along_axis(best_distances, order, axis=1)
+            best_indices = np.take_along_axis(best_indices, order, axis=1)
+    order = np.lexsort((best_indices, best_distances), axis=1)[:, :k]
+    best_distances = np.take_along_axis(best_distances, order, axis=1)
+    best_indices = np.take_along_axis(best_indices, order, axis=1)
+    return [
+        [(tests[i], d) for i, d in zip(bi, bd) if d != np.iinfo(np.int64).max]
+        for bi, bd in zip(best_indices.tolist(), best_distances.tolist())
+    ]
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+class StatementInterner:
+    # map statements of a bug to consecutive ids, starting with the given
+    # statements, e.g. the coverage statements, so that ids follow their
+    # order. Raw strings are standardized by `standardize` once each
+    def __init__(self, statements=(), standardize=None):
+        self.statements = []
+        self._ids = {}
+        self._raw_ids = {}
+        self._standardize = standardize
+        for s in statements:
+            self.intern(s)
+
+    def __len__(self):
+        return len(self.statements)
+
+    def intern(self, statement):
+        i = self._ids.get(statement)
+        if i is None:
+            i = self._ids[statement] = len(self.statements)
+            self.statements.append(statement)
+        return i
+
+    def intern_raw(self, raw):
+        i = self._raw_ids.get(raw)
+        if i is None:
+            i = self._raw_ids[raw] = self.intern(self._standardize(raw))
+        return i
+
+    def read_ids(self, file, separator=None):
+        # ids of the statements of a file, one per line, where only the part
+        # before the first `separator` names the statement
+        with open(file) as f:
+            return self.ids_of_text(f.read(), separator)
+
+    def ids_of_text(self, text, separator=None):
+        lines = text.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        if separator:
+            lines = [l.split(separator, 1)[0] for l in lines]
+        return np.fromiter(map(self.intern_raw, lines), dtype=np.int64,
+                           count=len(lines))
+
+    def remap(self, statements):
+        # global ids of the statements of another interner
+        return np.fromiter(map(self.intern, statements), dtype=np.int64,
+                           count=len(statements))
+
+    def count_map(self, ids):
+        # {statement: occurrences} of the id arrays, listed in the order of
+        # the first occurrences, as counting them one by one into a dict does
+        ids = np.concatenate(ids) if len(ids) else np.zeros(0, np.int64)
+        if len(ids) == 0:
+            return {}
+        counts = np.bincount(ids)
+        unique_ids, first = np.unique(ids, return_index=True)
+        unique_ids = unique_ids[np.argsort(first, kind='stable')]
+        return dict(zip([self.statements[i] for i in unique_ids.tolist()],
+                        counts[unique_ids].tolist()))
@@ -0,0 +1,122 @@
+import zipfile
+from os import getpid, remove, replace
+from os.path import exists
+
+from peewee import SqliteDatabase, Model, CharField, IntegerField
+
+from analysis.manifest import path_digest
+
+# rows are inserted, and classes queried, this many at a time
+_INSERT_BATCH_SIZE = 500
+
+
+class _IndexInfo(Model):
+    key = CharField(primary_key=True)
+    value = CharField()
+
+
+class _LineStatement(Model):
+    # line `src_class#line` of bug `bug` belongs to statement
+    # `src_class#stmt_line`, a line never belongs to another file
+    bug = CharField()
+    src_class = CharField()
+    line = IntegerField()
+    stmt_line = IntegerField()
+
+    class Meta:
+        indexes = ((('bug', 'src_class', 'line'), True),)
+
+
+_MODELS = [_IndexInfo, _LineStatement]
+
+
+def _connect(db_file):
+    db = SqliteDatabase(db_file, pragmas={'journal_mode': 'off',
+                                          'synchronous': 'off'})
+    db.bind(_MODELS)
+    db.connect()
+    return db
+
+
+def _stored_digest():
+    row = _IndexInfo.get_or_none(_IndexInfo.key == 'digest')
+    return row.value if row else None
+
+
+def build_line_index(zip_file, db_file):
+    # compile the line to statement maps of every bug into a sqlite file,
+    # built aside and moved into place, so readers never see half of it
+    from analysis.metrics import _load_lines_stmt_map
+    tmp_file = '%s.%d.tmp' % (db_file, getpid())
+    if exists(tmp_file):
+        remove(tmp_file)
+    db = _connect(tmp_file)
+    with db.atomic():
+        db.create_tables(_MODELS)
+        zf = zipfile.ZipFile(zip_file)
+        bugs = set([x.split('b.')[0] for x in zf.namelist()])
+        for b in sorted(bugs):
+            rows = [(b, line[0], line[1], stmt[1]) for line, stmt in
+                    _load_lines_stmt_map(zf, b).items()]
+            for i in range(0, len(rows), _INSERT_BATCH_SIZE):
+                _LineStatement.insert_many(
+                    rows[i:i + _INSERT_BATCH_SIZE],
+                    fields=[_LineStatement.bug, _LineStatement.src_class,
+                            _LineStatement.line, _LineStatement.stmt_line]
+                ).execute()
+        _IndexInfo.create(key='digest', value=path_digest(zip_file))
+    db.close()
+    replace(tmp_file, db_file)
+
+
+class LineIndex:
+    # line to statement lookups of the bugs of a source-code-lines.zip,
+    # backed by a sqlite file compiled on first use and whenever the zip
+    # file changes
+    def __init__(self, zip_file, db_file):
+        self.zip_file = zip_file
+        self.db_file = db_file
+        self._db = None
+        self._pid = None
+
+    def _open(self):
+        # a sqlite connection must not be shared with forked processes
+        if self._pid == getpid():
+            return
+        if exists(self.db_file):
+            self._db = _connect(self.db_file)
+            if _stored_digest() == path_digest(self.zip_file):
+                self._pid = getpid()
+                return
+            self._db.close()
+        build_line_index(self.zip_file, self.db_file)
+        self._db = _connect(self.db_file)
+        self._pid = getpid()
+
+    def lines_stmt_map(self, bug):
+        # {line: statement} of every line of the bug
+        self._open()
+        query = (_LineStatement
+                 .select(_LineStatement.src_class, _LineStatement.line,
+                         _LineStatement.stmt_line)
+                 .where(_LineStatement.bug == bug)
+                 .tuples())
+        return {(c, l): (c, s) for c, l, s in query}
+
+    def lines_to_stmts(self, bug, lines):
+        # map lines [(class, line)...] of the bug to their statements at
+        # once, lines that are not statements map to themselves
+        self._open()
+        lines = list(lines)
+        stmt_map = {}
+        classes = sorted(set(c for c, _ in lines))
+        for i in range(0, len(classes), _INSERT_BATCH_SIZE):
+            query = (_LineStatement
+                     .select(_LineStatement.src_class, _LineStatement.line,
+                             _LineStatement.stmt_line)
+                     .where((_LineStatement.bug == bug) &
+                            (_LineStatement.src_class.in_(
+                                classes[i:i + _INSERT_BATCH_SIZE])))
+                     .tuples())
+            stmt_map.update(((c, l), (c, s)) for c, l, s in query)
+        return [stmt_map.get(l, l) for l in lines]
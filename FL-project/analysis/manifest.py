@@ -0,0 +1,83 @@
+import hashlib
+import inspect
+import json
+from functools import lru_cache
+from os import makedirs, walk, stat
+from os.path import join, exists, isdir, dirname, basename, relpath
+
+# manifests are kept aside in a hidden directory of the output directory, so
+# that listing the output directory sees the artifacts only
+_MANIFEST_DIR_NAME = '.manifest'
+
+
+@lru_cache(maxsize=None)
+def _file_digest(file, size, mtime_ns):
+    h = hashlib.sha1()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _dir_digest(directory):
+    # hashing every trace file would cost as much as parsing them, so a
+    # directory is identified by the names, sizes and mtimes of its files.
+    # Hidden directories hold caches derived from the other files, such as
+    # .spectra-cache and .report-cache, and are left out
+    h = hashlib.sha1()
+    for root, dirs, files in walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for f in sorted(files):
+            st = stat(join(root, f))
+            h.update(('%s,%d,%d\n' % (relpath(join(root, f), directory),
+                                      st.st_size, st.st_mtime_ns)).encode())
+    return h.hexdigest()
+
+
+def path_digest(path):
+    if not exists(path):
+        return None
+    if isdir(path):
+        return _dir_digest(path)
+    st = stat(path)
+    return _file_digest(path, st.st_size, st.st_mtime_ns)
+
+
+def code_digest(*objs):
+    # digest of the source code of modules, classes or functions
+    h = hashlib.sha1()
+    for obj in objs:
+        h.update(inspect.getsource(obj).encode())
+    return h.hexdigest()
+
+
+def build_manifest(inputs, *, code=(), params=None):
+    return {
+        'inputs': {p: path_digest(p) for p in inputs},
+        'code': code_digest(*code),
+        # round trip through json so that it compares equal to a loaded one
+        'params': json.loads(json.dumps(params or {}, sort_keys=True)),
+    }
+
+
+def _manifest_file(output_file):
+    return join(dirname(output_file), _MANIFEST_DIR_NAME,
+                basename(output_file) + '.json')
+
+
+def is_up_to_date(output_file, manifest):
+    manifest_file = _manifest_file(output_file)
+    if not (exists(output_file) and exists(manifest_file)):
+        return False
+    with open(manifest_file) as f:
+        try:
+            return json.load(f) == manifest
+        except ValueError:
+            return False
+
+
+def write_manifest(output_file, manifest):
+    manifest_file = _manifest_file(output_file)
+    makedirs(dirname(manifest_file), exist_ok=True)
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, sort_keys=True)
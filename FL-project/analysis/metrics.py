@@ -1,12 +1,24 @@
 import csv
 import zipfile
+from collections.abc import Mapping
+from functools import lru_cache
+from os import getpid
 from os.path import dirname, realpath, join
 
+import numpy as np
+
+from analysis.lineindex import LineIndex
+from analysis.parallel import run_tasks
+from analysis.rankfile import RankList, read_rank_list, \
+    read_rank_list_head, tie_ranks
+
 _FILE_DIR = dirname(realpath(__file__))
 _BUGGY_LINES_DIR = join(_FILE_DIR, 'misc', 'stats', 'defects4j.buggy-lines')
 _BUGGY_LINES_ZIP_FILE = join(_BUGGY_LINES_DIR, 'buggy-lines.zip')
 _SLOC_CSV_FILE = join(_BUGGY_LINES_DIR, 'sloc.csv')
 _SOURCE_CODE_LINES_ZIP_FILE = join(_BUGGY_LINES_DIR, 'source-code-lines.zip')
+_SOURCE_CODE_LINES_INDEX_FILE = join(_BUGGY_LINES_DIR,
+                                     'source-code-lines.sqlite3')
 
 
 def _standardize_buggy_line_statement(line):
@@ -52,17 +64,33 @@ def _load_exact_buggy_lines(zf, bug, compressed_files):
     return buggy_lines, omission_lines, omission_candidates
 
 
+@lru_cache(maxsize=None)
+def _open_zip_file(zip_file, pid):
+    # a zip file object must not be shared with forked processes, hence
+    # one per process
+    return zipfile.ZipFile(zip_file)
+
+
+def _zip_file(zip_file):
+    return _open_zip_file(zip_file, getpid())
+
+
+def _buggy_lines_bugs():
+    # the zip central directory serves as the index of bugs
+    zf = _zip_file(_BUGGY_LINES_ZIP_FILE)
+    bugs = set([x.split('.')[0] for x in zf.namelist()])
+    return [(b.split('-')[0], int(b.split('-')[1])) for b in bugs]
+
+
+def _load_bug_buggy_lines(project_bug_id):
+    project, bug_id = project_bug_id
+    zf = _zip_file(_BUGGY_LINES_ZIP_FILE)
+    return _load_exact_buggy_lines(zf, '%s-%d' % (project, bug_id),
+                                   set(zf.namelist()))
+
+
 def _load_buggy_lines():
-    zf = zipfile.ZipFile(_BUGGY_LINES_ZIP_FILE)
-    compressed_files = zf.namelist()
-    bugs = set([x.split('.')[0] for x in compressed_files])
-    buggy_lines_map = {}
-    for b in bugs:
-        project, bug_id = b.split('-')
-        bug_id = int(bug_id)
-        b, o, oc = _load_exact_buggy_lines(zf, b, compressed_files)
-        buggy_lines_map[(project, bug_id)] = (b, o, oc)
-    return buggy_lines_map
+    return {pb: _load_bug_buggy_lines(pb) for pb in _buggy_lines_bugs()}
 
 
 def _load_sloc_map():
@@ -85,38 +113,82 @@ def _load_lines_stmt_map(zf, b):
     return lines_stmt_map
 
 
+# line to statement maps are compiled once into an indexed sqlite file
+_LINE_INDEX = LineIndex(_SOURCE_CODE_LINES_ZIP_FILE,
+                        _SOURCE_CODE_LINES_INDEX_FILE)
+
+
+def get_line_index():
+    return _LINE_INDEX
+
+
 def _load_buggy_stmts_map():
-    zf = zipfile.ZipFile(_SOURCE_CODE_LINES_ZIP_FILE)
+    zf = _zip_file(_SOURCE_CODE_LINES_ZIP_FILE)
     compressed_files = zf.namelist()
-    buggy_lines_map = _load_buggy_lines()
+    buggy_lines_map = _BUGGY_LINES_MAP
     bugs = set([x.split('b.')[0] for x in compressed_files])
     buggy_stmts_map = {}
     for b in bugs:
-        lines_stmt_map = _load_lines_stmt_map(zf, b)
-
-        def line2stmt(line):
-            if line not in lines_stmt_map:
-                return line
-            else:
-                return lines_stmt_map[line]
-
         project, bid = b.split('-')
         bid = int(bid)
         buggy_lines = buggy_lines_map[project, bid]
-        buggy_stmts = [set(map(line2stmt, bls)) for bls in buggy_lines]
+        buggy_stmts = [set(_LINE_INDEX.lines_to_stmts(b, bls))
+                       for bls in buggy_lines]
         buggy_stmts_map[project, bid] = buggy_stmts
     return buggy_stmts_map
 
 
+class _LazyMap(Mapping):
+    # read-only map loaded on first use, `load_keys` returns all keys and
+    # `load_value` loads the value of one key. If `load_value` is None,
+    # `load_keys` returns the whole dict at once
+    def __init__(self, load_keys, load_value=None):
+        self._load_keys = load_keys
+        self._load_value = load_value
+        self._keys = None
+        self._values = {}
+
+    def _key_set(self):
+        if self._keys is None:
+            if self._load_value:
+                self._keys = set(self._load_keys())
+            else:
+                self._values = self._load_keys()
+                self._keys = set(self._values)
+        return self._keys
+
+    def __getitem__(self, key):
+        if key not in self._key_set():
+            raise KeyError(key)
+        if key not in self._values:
+            self._values[key] = self._load_value(key)
+        return self._values[key]
+
+    def __contains__(self, key):
+        return key in self._key_set()
+
+    def __iter__(self):
+        return iter(self._key_set())
+
+    def __len__(self):
+        return len(self._key_set())
+
+
 # _BUGGY_LINES_MAP = _load_buggy_stmts_map()
-_BUGGY_LINES_MAP = _load_buggy_lines()
-_SLOC_MAP = _load_sloc_map()
+# ground truth is loaded lazily and per bug, so importing this module or
+# querying a single bug does not parse the whole archive
+_BUGGY_LINES_MAP = _LazyMap(_buggy_lines_bugs, _load_bug_buggy_lines)
+_SLOC_MAP = _LazyMap(_load_sloc_map)
 
 
 def get_buggy_lines_map():
     return _BUGGY_LINES_MAP
 
 
+def get_sloc_map():
+    return _SLOC_MAP
+
+
 def _standardize_string_statement(s):
     c, l = s.split('#')
     return c, int(l)
@@ -145,21 +217,85 @@ def nCr(n, r):
     return numer // demon
 
 
+@lru_cache(maxsize=None)
 def E_inspect(st, en, nf):
-    expected = float(st)
+    # expected position of the first of nf faulty elements placed uniformly
+    # among the n tied elements of positions [st, en], that is st plus
+    # sum_k k * C(n - k - 1, nf - 1) / C(n, nf), which is (n - nf) / (nf + 1)
+    if nf < 1:
+        raise ValueError('there must be at least one faulty element')
     n = en - st + 1
-    for k in range(1, n - nf + 1):
-        term = float(nCr(n - k - 1, nf - 1) * k) / nCr(n, nf)
-        expected += term
-    return expected
+    if n <= nf:
+        return float(st)
+    return st + (n - nf) / (nf + 1)
+
+
+def _faulty_mask(rank_list, faulty_elements):
+    faulty_statements = set('%s#%d' % e for e in faulty_elements)
+    table_mask = np.array([s in faulty_statements
+                           for s in rank_list.statements], dtype=bool)
+    return table_mask[rank_list.stmt_ids]
+
+
+def _method_level_rank_list(rank_list, faulty_elements, method_map_file):
+    # rank methods by the highest suspiciousness of their statements
+    mmap_pairs = set(tuple(l.rstrip('\n').split(',', maxsplit=1)) for l in
+                     open(method_map_file).readlines())
+    method_map = {_standardize_string_statement(s): m for s, m in
+                  mmap_pairs}
+    faulty_elements = set(
+        map(lambda x: method_map.get(x, x), faulty_elements))
+    table_methods = [
+        method_map.get(e, e) for e in
+        map(_standardize_string_statement, rank_list.statements)]
+    methods = [table_methods[i] for i in rank_list.stmt_ids.tolist()]
+    method_susps_sets = {m: set() for m in set(methods)}
+    for m, susps in zip(methods, rank_list.scores.tolist()):
+        method_susps_sets[m].add(susps)
+    method_rank_susps = []
+    for method, susps_set in method_susps_sets.items():
+        method_rank_susps.append((method, max(susps_set)))
+    method_rank_susps.sort(key=lambda x: x[1], reverse=True)
+    scores = np.array([susps for _, susps in method_rank_susps],
+                      dtype=np.float64)
+    is_faulty = np.array([m in faulty_elements for m, _ in method_rank_susps],
+                         dtype=bool)
+    return tie_ranks(scores), scores, is_faulty
 
 
 def collect_statistics(project, bug_id, rank_list_file, *, method_map_file=None,
-                       top_n, top_ln, wet_n, ctop_ln):
+                       top_n, top_ln, wet_n, ctop_ln, streaming=False):
     buggy_lines, _, omission_candidates = _BUGGY_LINES_MAP[
         (project, bug_id)]
     faulty_elements = buggy_lines.union(omission_candidates)
 
+    # rank lists queried from a results database come already read
+    rank_list = rank_list_file
+    len_rank = None
+    if isinstance(rank_list, RankList):
+        pass
+    elif streaming and not method_map_file:
+        # every statistic but the length is decided by the elements up to
+        # the tie group of the first faulty one, the rest is only counted
+        rank_list, len_rank = read_rank_list_head(
+            rank_list_file, set('%s#%d' % e for e in faulty_elements))
+    else:
+        rank_list = read_rank_list(rank_list_file)
+    if len(rank_list) and method_map_file:
+        ranks, scores, is_faulty = _method_level_rank_list(
+            rank_list, faulty_elements, method_map_file)
+    else:
+        ranks, scores = rank_list.ranks, rank_list.scores
+        is_faulty = _faulty_mask(rank_list, faulty_elements)
+    return _statistics(ranks, scores, is_faulty, top_n=top_n, top_ln=top_ln,
+                       wet_n=wet_n, ctop_ln=ctop_ln, len_rank=len_rank)
+
+
+def _statistics(ranks, scores, is_faulty, *, top_n, top_ln, wet_n, ctop_ln,
+                len_rank=None):
+    # ranks, scores and is_faulty may be a head of the rank list, at least up
+    # to the element after the tie group of the first faulty element, and
+    # len_rank is then the length of the whole rank list
     top_rank = None
     top_line_no = None
     ctop_line_no = None
@@ -168,84 +304,40 @@ def collect_statistics(project, bug_id, rank_list_file, *, method_map_file=None,
     is_ctop_ln = [False] * len(ctop_ln)
     wet_s_n = [0] * len(wet_n)
     e_inspect = None
-
-    rk_lines = [
-        l.rstrip('\n').split(' ', 2)
-        for l in
-        open(rank_list_file).readlines()
-    ]
-
-    ranked_elements = [
-        (float(l[0]), _standardize_string_statement(l[1]), eval(l[2]))
-        for l
-        in rk_lines
-    ]
-
-    if ranked_elements and method_map_file:
-        mmap_pairs = set(tuple(l.rstrip('\n').split(',', maxsplit=1)) for l in
-                         open(method_map_file).readlines())
-        method_map = {_standardize_string_statement(s): m for s, m in
-                      mmap_pairs}
-        faulty_elements = set(
-            map(lambda x: method_map.get(x, x), faulty_elements))
-        method_susps_sets = {m: set() for m in (
-            set(map(lambda x: method_map.get(x[1], x[1]), ranked_elements)))}
-        for (r, e, susps) in ranked_elements:
-            method_susps_sets[method_map.get(e, e)].add(susps)
-        method_rank_susps = []
-        for method, susps_set in method_susps_sets.items():
-            susps = max(susps_set)
-            method_rank_susps.append([-1, method, susps])
-        method_rank_susps.sort(key=lambda x: x[2], reverse=True)
-        # print(len(method_rank_susps), project, bug_id)
-        last_i, last_susp = 0, method_rank_susps[0][2]
-        for i, (_, _, susp) in enumerate(method_rank_susps):
-            if last_susp != susp:
-                rk = (last_i + i - 1) / 2
-                for j in range(last_i, i):
-                    method_rank_susps[j][0] = rk
-                last_i = i
-                last_susp = susp
-        for j in range(last_i, len(method_rank_susps)):
-            rk = (last_i + len(method_rank_susps) - 1) / 2
-            method_rank_susps[j][0] = rk
-        ranked_elements = method_rank_susps
-
-    pre_susps = None
-    pre_line = -1
-    for idx, (rank, element, suspicious) in enumerate(ranked_elements):
-        if not pre_susps or pre_susps != suspicious:
-            pre_susps = suspicious
-            pre_line = idx + 1
-        # is buggy line
-        if element in faulty_elements:
-            for i, n in enumerate(top_n):
-                if rank + 1 <= n:
-                    is_top_n[i] = True
-            if not top_rank:
-                top_rank = rank + 1
-            for i, ln in enumerate(top_ln):
-                if idx + 1 <= ln:
-                    is_top_ln[i] = True
-            if not top_line_no:
-                top_line_no = idx + 1
-            for i, ln in enumerate(ctop_ln):
-                if pre_line <= ln:
-                    is_ctop_ln[i] = True
-            if not ctop_line_no:
-                ctop_line_no = pre_line
-            if not e_inspect:
-                end = idx + 1
-                count = 1
-                while end < len(ranked_elements) \
-                        and ranked_elements[end][0] == rank:
-                    if ranked_elements[end][1] in faulty_elements:
-                        count += 1
-                    end += 1
-                if end >= len(ranked_elements):
-                    end = len(ranked_elements) - 1
-                # print(rank_list_file, pre_line, end, count)
-                e_inspect = E_inspect(pre_line, end, count)
+    n_head = len(ranks)
+    if len_rank is None:
+        len_rank = n_head
+
+    faulty_indices = np.flatnonzero(is_faulty)
+    if len(faulty_indices) > 0:
+        # an element starts a new line of ties if its suspiciousness differs
+        # from the previous one, or the previous one is 0
+        starts = np.ones(n_head, dtype=bool)
+        starts[1:] = (scores[1:] != scores[:-1]) | (scores[:-1] == 0)
+        pre_lines = np.maximum.accumulate(
+            np.where(starts, np.arange(n_head), 0)) + 1
+
+        idx = int(faulty_indices[0])
+        rank = float(ranks[idx])
+        min_rank = float(ranks[faulty_indices].min())
+        min_pre_line = int(pre_lines[faulty_indices].min())
+        for i, n in enumerate(top_n):
+            is_top_n[i] = min_rank + 1 <= n
+        top_rank = rank + 1
+        for i, ln in enumerate(top_ln):
+            is_top_ln[i] = idx + 1 <= ln
+        top_line_no = idx + 1
+        for i, ln in enumerate(ctop_ln):
+            is_ctop_ln[i] = min_pre_line <= ln
+        ctop_line_no = int(pre_lines[idx])
+
+        # the faulty elements tied with the first one
+        others = np.flatnonzero(ranks[idx + 1:] != rank)
+        end = idx + 1 + int(others[0]) if len(others) > 0 else n_head
+        count = 1 + int(is_faulty[idx + 1:end].sum())
+        if end >= n_head:
+            end = n_head - 1
+        e_inspect = E_inspect(ctop_line_no, end, count)
 
     for i, ln in enumerate(wet_n):
         if top_line_no and ln >= top_line_no:
@@ -253,19 +345,77 @@ def collect_statistics(project, bug_id, rank_list_file, *, method_map_file=None,
         else:
             wet_s_n[i] = ln
 
-    len_rank = len(ranked_elements)
-
     return top_rank, top_line_no, is_top_n, is_top_ln, wet_s_n, \
            ctop_line_no, is_ctop_ln, e_inspect, len_rank
 
 
+def _method_map_file(method_map_dir, project, bug_id):
+    if not method_map_dir:
+        return None
+    return join(method_map_dir, '%s-%s.mmap' % (project, bug_id))
+
+
+def _bug_statistics(project, bug_id, formula_rank_list_files, method_map_file,
+                    options, results_db=None):
+    if results_db:
+        from analysis.resultsdb import query_rank_lists
+        # the rank lists of the bug are queried by the worker, so that they
+        # are neither held by nor sent from the parent
+        rank_lists = {formula: rank_list for _, _, formula, rank_list in
+                      query_rank_lists(results_db, formulas=[
+                          f for f, _ in formula_rank_list_files],
+                                       bugs=[(project, bug_id)])}
+        formula_rank_list_files = [(f, rank_lists[f]) for f, _ in
+                                   formula_rank_list_files]
+    return [(formula, collect_statistics(project, bug_id, rank_list_file,
+                                         method_map_file=method_map_file,
+                                         **options))
+            for formula, rank_list_file in formula_rank_list_files]
+
+
+def collect_all_statistics(rank_list_files, *, method_map_dir=None, jobs=None,
+                           top_n=(1, 2, 3, 5, 10, 20),
+                           top_ln=(1, 2, 3, 5, 10, 20),
+                           wet_n=(1, 2, 3, 5, 10, 20),
+                           ctop_ln=(1,), streaming=False, results_db=None):
+    # collect the statistics of [(project, bug_id, formula, rank list file)...]
+    # on a pool of `jobs` processes, every rank list is read once. The rank
+    # lists of a bug go to the same worker, which loads the ground truth and
+    # the method map of the bug once. With `results_db`, rank list files are
+    # not used and the workers query the rank lists from the database.
+    # Return {formula: {(project, bug_id): statistics}} for report_metrics
+    bug_rank_list_files = {}
+    for project, bug_id, formula, rank_list_file in rank_list_files:
+        bug_rank_list_files.setdefault((project, bug_id), []).append(
+            (formula, rank_list_file))
+    options = dict(top_n=top_n, top_ln=top_ln, wet_n=wet_n, ctop_ln=ctop_ln,
+                   streaming=streaming)
+    tasks = [(project, bug_id, files,
+              _method_map_file(method_map_dir, project, bug_id), options,
+              results_db)
+             for (project, bug_id), files in bug_rank_list_files.items()]
+    statistics = {}
+    for (project, bug_id, *_), succeeded, result in \
+            run_tasks(_bug_statistics, tasks, jobs=jobs):
+        if not succeeded:
+            raise RuntimeError('failed to collect statistics of %s-%s:\n%s'
+                               % (project, bug_id, result))
+        for formula, bug_statistics in result:
+            statistics.setdefault(formula, {})[project, bug_id] = \
+                bug_statistics
+    return statistics
+
+
 def report_metrics(formula, rank_list_files, *, prt_table=None,
                    show_top_bugs=False, method_map_dir=None, output_csv=None,
+                   statistics=None, streaming=False,
                    top_n=(1, 2, 3, 5, 10, 20),
                    top_ln=(1, 2, 3, 5, 10, 20),
                    wet_n=(1, 2, 3, 5, 10, 20),
                    ctop_ln=(1,),
                    e_inspect_n=(1, 3, 5)):
+    # statistics of the bugs may be collected ahead by collect_all_statistics,
+    # the others are collected here
     if not rank_list_files or len(rank_list_files) == 0:
         raise ValueError('rank list files must not be empty')
     top_n_count = [0] * len(top_n)
@@ -282,20 +432,20 @@ def report_metrics(formula, rank_list_files, *, prt_table=None,
     ctop_lines_no = []
     e_inspect_n_count = [0] * len(e_inspect_n)
     pb_id_list = []
+    statistics = statistics or {}
     for project, bug_id, rank_list_file in rank_list_files:
-        method_map_file = None
-        if method_map_dir:
-            method_map_file = join(method_map_dir,
-                                   '%s-%s.mmap' % (project, bug_id))
         pb_id_list.append('%s-%s' % (project, bug_id))
-        top_rank, top_line_no, is_top_n, is_top_ln, wet_s_n, \
-        ctop_line_no, is_ctop_ln, e_inspect, len_rank = \
-            collect_statistics(
+        bug_statistics = statistics.get((project, bug_id))
+        if bug_statistics is None:
+            bug_statistics = collect_statistics(
                 project, bug_id, rank_list_file,
-                method_map_file=method_map_file,
+                method_map_file=_method_map_file(method_map_dir, project,
+                                                 bug_id),
                 top_n=top_n,
                 top_ln=top_ln,
-                wet_n=wet_n, ctop_ln=ctop_ln)
+                wet_n=wet_n, ctop_ln=ctop_ln, streaming=streaming)
+        top_rank, top_line_no, is_top_n, is_top_ln, wet_s_n, \
+        ctop_line_no, is_ctop_ln, e_inspect, len_rank = bug_statistics
         for i in range(len(top_n)):
             if is_top_n[i]:
                 top_n_count[i] += 1
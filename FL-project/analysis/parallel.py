@@ -0,0 +1,31 @@
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import cpu_count
+
+
+def _call(func, task):
+    try:
+        return True, func(*task)
+    except Exception:
+        return False, traceback.format_exc()
+
+
+def run_tasks(func, tasks, *, jobs=None):
+    # run func(*task) for every task on a pool of `jobs` processes. Tasks
+    # are handed out one at a time in the given order to whichever worker
+    # is free, and (task, succeeded, result or error) is yielded as soon as
+    # a task is finished. A crashed worker fails its pending tasks instead
+    # of silently dropping them
+    jobs = jobs or cpu_count()
+    if jobs == 1:
+        for task in tasks:
+            yield (task,) + _call(func, task)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(_call, func, task): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                succeeded, result = future.result()
+            except Exception as e:
+                succeeded, result = False, repr(e)
+            yield futures[future], succeeded, result
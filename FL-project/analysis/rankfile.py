@@ -0,0 +1,182 @@
+import sys
+
+import numpy as np
+
+# a binary rank list is laid out as
+#   magic | n elements (int64) | statement table size (int64) |
+#   statement table (utf-8, '\n' separated) |
+#   statement ids (int32 x n) | suspiciousness (float64 x n) |
+#   ranks (float64 x n)
+_BINARY_MAGIC = b'FLRANK1\n'
+
+
+class RankList:
+    # a rank list in columnar form, the i-th element is statement
+    # statements[stmt_ids[i]] ranked ranks[i] with suspiciousness scores[i]
+    def __init__(self, statements, stmt_ids, scores, ranks):
+        self.statements = statements
+        self.stmt_ids = stmt_ids
+        self.scores = scores
+        self.ranks = ranks
+
+    def __len__(self):
+        return len(self.stmt_ids)
+
+    def rows(self):
+        # [(rank, statement, suspiciousness)...]
+        return list(zip(self.ranks.tolist(),
+                        [self.statements[i] for i in self.stmt_ids.tolist()],
+                        self.scores.tolist()))
+
+
+def _tie_groups(scores):
+    # return the first and last index of every group of tied elements,
+    # note nan != nan, so every nan starts a new group
+    scores = np.asarray(scores, dtype=np.float64)
+    n = len(scores)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], scores[1:] != scores[:-1])))
+    ends = np.append(starts[1:], n) - 1
+    return starts, ends
+
+
+def tie_ranks(scores):
+    # elements with equal suspiciousness share the average of their
+    # 0-based positions, scores must be sorted already
+    starts, ends = _tie_groups(scores)
+    return np.repeat((starts + ends) / 2, ends - starts + 1)
+
+
+def _write_text(file, statements, scores, ranks):
+    with open(file, 'w') as f:
+        f.writelines('%.1f %s %s\n' % row
+                     for row in zip(ranks.tolist(), statements, scores))
+
+
+def rank_list_to_bytes(rank_list):
+    table = '\n'.join(rank_list.statements).encode()
+    return b''.join([
+        _BINARY_MAGIC,
+        np.array([len(rank_list), len(table)], dtype='<i8').tobytes(),
+        table,
+        np.asarray(rank_list.stmt_ids, dtype='<i4').tobytes(),
+        np.asarray(rank_list.scores, dtype='<f8').tobytes(),
+        np.asarray(rank_list.ranks, dtype='<f8').tobytes(),
+    ])
+
+
+def _write_binary(file, statements, scores, ranks):
+    with open(file, 'wb') as f:
+        f.write(rank_list_to_bytes(RankList(
+            statements, np.arange(len(statements)), scores, ranks)))
+
+
+def write_rank_list(susp_list, file, *, binary=False):
+    # susp_list is [(statement, suspiciousness)...] sorted by suspiciousness
+    statements = [s for s, _ in susp_list]
+    scores = [susp for _, susp in susp_list]
+    starts, ends = _tie_groups(scores)
+    ranks = np.repeat((starts + ends) / 2, ends - starts + 1)
+    # every element of a tie group is written with the score of its first
+    scores = [scores[i] for i in np.repeat(starts, ends - starts + 1).tolist()]
+    if binary:
+        _write_binary(file, statements, scores, ranks)
+    else:
+        _write_text(file, statements, scores, ranks)
+
+
+def is_binary_rank_list(file):
+    with open(file, 'rb') as f:
+        return f.read(len(_BINARY_MAGIC)) == _BINARY_MAGIC
+
+
+def rank_list_from_bytes(data):
+    offset = len(_BINARY_MAGIC)
+    n, table_size = np.frombuffer(data, dtype='<i8', count=2, offset=offset)
+    n, table_size = int(n), int(table_size)
+    offset += 16
+    table = bytes(data[offset:offset + table_size]).decode()
+    statements = table.split('\n') if n > 0 else []
+    offset += table_size
+    stmt_ids = np.frombuffer(data, dtype='<i4', count=n, offset=offset)
+    offset += 4 * n
+    scores = np.frombuffer(data, dtype='<f8', count=n, offset=offset)
+    offset += 8 * n
+    ranks = np.frombuffer(data, dtype='<f8', count=n, offset=offset)
+    return RankList(statements, stmt_ids, scores, ranks)
+
+
+def _read_binary(file):
+    with open(file, 'rb') as f:
+        return rank_list_from_bytes(f.read())
+
+
+def _read_text(file):
+    # statements never contain spaces, so the whole file splits into
+    # (rank, statement, suspiciousness) triples, and numpy converts the
+    # numbers, including inf and nan, without eval
+    with open(file) as f:
+        text = f.read()
+    tokens = text.split()
+    if len(tokens) % 3 != 0 or len(tokens) // 3 != text.count('\n') + (
+            1 if text and not text.endswith('\n') else 0):
+        rows = [l.split(' ', 2) for l in text.splitlines()]
+        tokens = [t for row in rows for t in row]
+    statements = tokens[1::3]
+    return RankList(statements, np.arange(len(statements), dtype=np.int32),
+                    np.array(tokens[2::3], dtype=np.float64),
+                    np.array(tokens[0::3], dtype=np.float64))
+
+
+def read_rank_list(file):
+    # read a rank list of either text or binary format
+    if is_binary_rank_list(file):
+        return _read_binary(file)
+    return _read_text(file)
+
+
+def _count_lines(f):
+    count, last = 0, b'\n'
+    for block in iter(lambda: f.read(1 << 20), b''):
+        count += block.count(b'\n')
+        last = block[-1:]
+    return count + (last != b'\n')
+
+
+def read_rank_list_head(file, statements):
+    # read a rank list up to the end of the tie group of the first element
+    # of `statements`, the rest of a text rank list is only counted. Return
+    # the head and the length of the whole rank list
+    if is_binary_rank_list(file):
+        rank_list = _read_binary(file)
+        return rank_list, len(rank_list)
+    rows = []
+    stop_rank = None
+    with open(file, 'rb') as f:
+        for line in f:
+            row = line.decode().rstrip('\n').split(' ', 2)
+            if len(row) < 3:
+                continue
+            rows.append(row)
+            rank = float(row[0])
+            if stop_rank is None:
+                if row[1] in statements:
+                    stop_rank = rank
+            elif rank != stop_rank:
+                break
+        length = len(rows) + _count_lines(f)
+    return RankList([r[1] for r in rows], np.arange(len(rows), dtype=np.int32),
+                    np.array([r[2] for r in rows], dtype=np.float64),
+                    np.array([r[0] for r in rows], dtype=np.float64)), length
+
+
+def export_text_rank_list(file, text_file):
+    rank_list = read_rank_list(file)
+    _write_text(text_file, [r[1] for r in rank_list.rows()],
+                rank_list.scores.tolist(), rank_list.ranks)
+
+
+if __name__ == '__main__':
+    # python -m analysis.rankfile binary-rank-list text-rank-list
+    export_text_rank_list(sys.argv[1], sys.argv[2])
@@ -1,11 +1,25 @@
+import hashlib
 from abc import abstractmethod, ABC
+from collections import Counter
 from math import sqrt, pow
-from os import makedirs
-from os.path import join, exists
+from os import makedirs, cpu_count
+from os.path import join
 from loguru import logger
 import re
 
-from analysis import gzoltar_load_coverage_matrix
+import numpy as np
+
+from analysis import gzoltar_load_coverage
+from analysis.coverage import count_spectrum
+from analysis.dirindex import DirectoryIndex
+from analysis.interner import StatementInterner
+from analysis.tracestore import TraceStore
+from localize.mutationstore import read_mutation_store
+from localize.testreport import TestReports
+from analysis.parallel import run_tasks
+from analysis.manifest import build_manifest, code_digest, is_up_to_date, \
+    write_manifest
+from analysis.rankfile import write_rank_list
 
 
 class SuspiciousFormula(ABC):
@@ -16,6 +30,11 @@ class SuspiciousFormula(ABC):
     def evaluate(self, passed, failed, total_passed, total_failed):
         pass
 
+    @abstractmethod
+    def evaluate_batch(self, passed, failed, total_passed, total_failed):
+        # evaluate on numpy arrays, arguments are broadcast together
+        pass
+
 
 class TarantulaFormula(SuspiciousFormula):
     def __init__(self):
@@ -26,6 +45,11 @@ class TarantulaFormula(SuspiciousFormula):
         b = passed / (total_passed + 1)
         return a / (a + b + 0.01)
 
+    def evaluate_batch(self, passed, failed, total_passed, total_failed):
+        a = np.true_divide(failed, np.add(total_failed, 1))
+        b = np.true_divide(passed, np.add(total_passed, 1))
+        return a / (a + b + 0.01)
+
 
 class OchiaiFormula(SuspiciousFormula):
     def __init__(self):
@@ -34,6 +58,10 @@ class OchiaiFormula(SuspiciousFormula):
     def evaluate(self, passed, failed, total_passed, total_failed):
         return failed / sqrt(total_failed * (passed + failed) + 0.01)
 
+    def evaluate_batch(self, passed, failed, total_passed, total_failed):
+        return np.true_divide(failed, np.sqrt(
+            np.multiply(total_failed, np.add(passed, failed)) + 0.01))
+
 
 class Op2Formula(SuspiciousFormula):
     def __init__(self):
@@ -42,6 +70,10 @@ class Op2Formula(SuspiciousFormula):
     def evaluate(self, passed, failed, total_passed, total_failed):
         return failed - passed / (total_passed + 0.01)
 
+    def evaluate_batch(self, passed, failed, total_passed, total_failed):
+        return np.subtract(failed, np.true_divide(
+            passed, np.add(total_passed, 0.01)))
+
 
 class BarinelFormula(SuspiciousFormula):
     def __init__(self):
@@ -50,6 +82,10 @@ class BarinelFormula(SuspiciousFormula):
     def evaluate(self, passed, failed, total_passed, total_failed):
         return 1 - (passed + 1) / (passed + failed + 0.01)
 
+    def evaluate_batch(self, passed, failed, total_passed, total_failed):
+        return 1 - np.true_divide(np.add(passed, 1),
+                                  np.add(passed, failed) + 0.01)
+
 
 class DStarFormula(SuspiciousFormula):
     def __init__(self, power=2):
@@ -60,6 +96,10 @@ class DStarFormula(SuspiciousFormula):
         return pow(failed, self.power) / (
                 passed + total_failed - failed + 0.01)
 
+    def evaluate_batch(self, passed, failed, total_passed, total_failed):
+        return np.power(np.asarray(failed, dtype=np.float64), self.power) / (
+                np.subtract(np.add(passed, total_failed), failed) + 0.01)
+
 
 _FORMULA_MAPS = {
     'tarantula': TarantulaFormula(),
@@ -91,23 +131,6 @@ def _standardize_statement(s):
     return _get_outer_most_class(c), int(l)
 
 
-def write_rank_list(susp_list, file):
-    with open(file, 'w') as f:
-        if len(susp_list) == 0:
-            return
-        last_i, last_susp = 0, susp_list[0][1]
-        for i, (_, susp) in enumerate(susp_list):
-            if last_susp != susp:
-                rk = (last_i + i - 1) / 2
-                for j in range(last_i, i):
-                    f.write('%.1f %s %s\n' % (rk, susp_list[j][0], last_susp))
-                last_i = i
-                last_susp = susp
-        for j in range(last_i, len(susp_list)):
-            rk = (last_i + len(susp_list) - 1) / 2
-            f.write('%.1f %s %s\n' % (rk, susp_list[j][0], last_susp))
-
-
 def all_keys(*args):
     keys = set([])
     for d in args:
@@ -119,139 +142,198 @@ def get_or_default(m, k, default=0):
     return m[k] if k in m else default
 
 
-def _read_mutation_logs(mutation_log_file):
-    if not exists(mutation_log_file):
-        return None
-    with open(mutation_log_file) as f:
-        # [[id, class, method, line number, instruction number, details]...]
-        logs = [l.rstrip('\n').split(',') for l in f.readlines()]
-        return logs
+def _rank_lists_manifest(results_dir, data_dir, mutants_dir, binary):
+    import sys
+    import analysis.coverage
+    import analysis.gzoltar
+    import analysis.interner
+    import analysis.rankfile
+    import analysis.tracestore
+    import localize.mutationstore
+    import localize.testreport
+    import localize.utils
+    # the rank lists directory may be under data_dir, so only traces and
+    # slices are taken as inputs from it
+    return build_manifest(
+        [results_dir, join(data_dir, 'trace'), join(data_dir, 'slice'),
+         mutants_dir],
+        code=(sys.modules[__name__], analysis.gzoltar, analysis.coverage,
+              analysis.interner, analysis.rankfile, analysis.tracestore,
+              localize.mutationstore, localize.testreport, localize.utils),
+        params={'binary': binary})
 
 
 def generate_rank_lists(results_dir, data_dir, mutants_dir, project, bug_id,
-                        rank_lists_dir=None):
-    from analysis import read_relevant_test_report
+                        rank_lists_dir=None, *, coverage_format='packed',
+                        incremental=False, binary=False, mutation_jobs=1):
+    from localize.utils import read_relevant_test_report
+
+    base_name = '%s-%d' % (project, bug_id)
+    if not rank_lists_dir:
+        rank_lists_dir = join(data_dir, 'rank_lists')
+    manifest = None
+    if incremental:
+        manifest = _rank_lists_manifest(results_dir, data_dir, mutants_dir,
+                                        binary)
+        rank_list_files = [
+            join(rank_lists_dir, base_name + '.' + suffix)
+            for suffix in list(_FORMULA_MAPS) + ['h0', 'h1', 'h2']
+        ]
+        if all(is_up_to_date(f, manifest) for f in rank_list_files):
+            logger.info('rank lists for {} are up to date', base_name)
+            return
 
     original_test_report = read_relevant_test_report(
-        results_dir, timeout_as_fail=False)
+        results_dir, timeout_as_fail=False, fingerprints=True)
 
-    coverage_matrix, statements, tests = gzoltar_load_coverage_matrix(
-        join(results_dir, 'origin', 'gzoltar'))
+    coverage_matrix, statements, tests = gzoltar_load_coverage(
+        join(results_dir, 'origin', 'gzoltar'), coverage_format)
     # initialize for all statements
     statements = [standardize_gzoltar_statement(s) for s in statements]
 
     fail_map, pass_map, total_failed, total_passed = get_spectrum_info(
         coverage_matrix, original_test_report, statements, tests)
 
+    # trace and slice directories are listed once for all lookups of the bug,
+    # and their statements share ids with the coverage statements
+    dir_index = DirectoryIndex()
+    interner = StatementInterner(statements, _standardize_statement)
+
     slice_failed_map, slice_passed_map, slice_total_failed, slice_total_passed \
-        = get_slice_info(data_dir, original_test_report, results_dir)
+        = get_slice_info(data_dir, original_test_report, results_dir,
+                         dir_index=dir_index, interner=interner)
 
     f2f_except_mutated_map, f2p_count, f2p_except_mutated_map, f2p_mutated_map, \
     p2f_before_map, p2f_count, f2f_count, *_ = \
         get_mutation_info(data_dir, mutants_dir, original_test_report,
-                          results_dir)
+                          results_dir, dir_index=dir_index, jobs=mutation_jobs,
+                          interner=interner)
 
     # generate spectrum-based rank lists
-    base_name = '%s-%d' % (project, bug_id)
-    if not rank_lists_dir:
-        rank_lists_dir = join(data_dir, 'rank_lists')
     makedirs(rank_lists_dir, exist_ok=True)
 
     generate_spectrum_based_rank_lists(rank_lists_dir, base_name, statements,
                                        pass_map, fail_map, total_passed,
-                                       total_failed)
+                                       total_failed, binary=binary)
 
     # generate h0, h1, h2
     generate_hybrid_rank_lists(rank_lists_dir, base_name, pass_map, fail_map,
                                slice_passed_map, slice_failed_map,
                                p2f_before_map, f2p_except_mutated_map,
                                f2p_mutated_map, f2f_except_mutated_map,
-                               total_passed, total_failed)
+                               total_passed, total_failed, binary=binary)
+    if manifest:
+        for f in rank_list_files:
+            write_manifest(f, manifest)
+
+
+def _map_to_array(m, statements, dtype=np.int64):
+    return np.fromiter((get_or_default(m, s) for s in statements),
+                       dtype=dtype, count=len(statements))
+
+
+def _write_ranked_susps(statements, susps, rank_list_file, binary):
+    susp_list = zip(map(lambda s: s[0] + '#' + str(s[1]), statements),
+                    susps.tolist())
+    ranked_susp_list = sorted(susp_list, key=lambda kv: kv[1], reverse=True)
+    write_rank_list(ranked_susp_list, rank_list_file, binary=binary)
 
 
 def generate_hybrid_rank_lists(rank_lists_dir, base_name, pass_map, fail_map,
                                slice_passed_map, slice_failed_map,
                                p2f_before_map, f2p_except_mutated_map,
                                f2p_mutated_map, f2f_except_mutated_map,
-                               total_passed, total_failed):
+                               total_passed, total_failed, *, binary=False):
     h0_rank_list_file = join(rank_lists_dir, base_name + '.h0')
     h1_rank_list_file = join(rank_lists_dir, base_name + '.h1')
     h2_rank_list_file = join(rank_lists_dir, base_name + '.h2')
-    all_statements = all_keys(pass_map, fail_map, slice_passed_map,
-                              slice_failed_map, p2f_before_map,
-                              f2p_except_mutated_map, f2p_mutated_map,
-                              f2f_except_mutated_map)
-    h0_susp_map, h1_susp_map, h2_susp_map = {}, {}, {}
-    for s in all_statements:
-        p, f = get_or_default(pass_map, s), get_or_default(fail_map, s)
-        tp, tf = total_passed, total_failed
-
-        p_slice, f_slice = get_or_default(slice_passed_map, s), get_or_default(
-            slice_failed_map, s)
-
-        p_mt, f_mt = get_or_default(p2f_before_map, s) + \
-                     get_or_default(f2p_except_mutated_map, s), \
-                     get_or_default(f2p_mutated_map, s) + \
-                     get_or_default(f2f_except_mutated_map, s)
-        # tp_mt, tf_mt = p2f_count + f2p_count, get_or_default(
-        #     f2f_except_mutated_map, s) + get_or_default(f2p_mutated_map, s)
-        tf_mt = get_or_default(
-            f2f_except_mutated_map, s) + get_or_default(f2p_mutated_map, s)
-
-        dstar_ins = get_formula_instance('dstar')
-        s_str = s[0] + '#' + str(s[1])
-        h0_susp_map[s_str] = dstar_ins.evaluate(
-            p + p_mt, f + f_mt, 0, tf + tf_mt)
-        h1_susp_map[s_str] = dstar_ins.evaluate(
-            p + p_slice, f + f_slice, 0, tf * 2)
-        h2_susp_map[s_str] = dstar_ins.evaluate(
-            p + p_mt + p_slice, f + f_mt + f_slice, 0, tf * 2 + tf_mt)
-    ranked_susp_list = sorted(h0_susp_map.items(),
-                              key=lambda kv: kv[1], reverse=True)
-    write_rank_list(ranked_susp_list, h0_rank_list_file)
-    ranked_susp_list = sorted(h1_susp_map.items(),
-                              key=lambda kv: kv[1], reverse=True)
-    write_rank_list(ranked_susp_list, h1_rank_list_file)
-    ranked_susp_list = sorted(h2_susp_map.items(),
-                              key=lambda kv: kv[1], reverse=True)
-    write_rank_list(ranked_susp_list, h2_rank_list_file)
+    all_statements = list(all_keys(pass_map, fail_map, slice_passed_map,
+                                   slice_failed_map, p2f_before_map,
+                                   f2p_except_mutated_map, f2p_mutated_map,
+                                   f2f_except_mutated_map))
+    p, f = _map_to_array(pass_map, all_statements), \
+           _map_to_array(fail_map, all_statements)
+    tf = total_failed
+
+    p_slice, f_slice = _map_to_array(slice_passed_map, all_statements), \
+                       _map_to_array(slice_failed_map, all_statements)
+
+    p_mt, f_mt = _map_to_array(p2f_before_map, all_statements) + \
+                 _map_to_array(f2p_except_mutated_map, all_statements), \
+                 _map_to_array(f2p_mutated_map, all_statements) + \
+                 _map_to_array(f2f_except_mutated_map, all_statements)
+    # tp_mt, tf_mt = p2f_count + f2p_count, get_or_default(
+    #     f2f_except_mutated_map, s) + get_or_default(f2p_mutated_map, s)
+    tf_mt = f_mt
+
+    dstar_ins = get_formula_instance('dstar')
+    _write_ranked_susps(all_statements, dstar_ins.evaluate_batch(
+        p + p_mt, f + f_mt, 0, tf + tf_mt), h0_rank_list_file, binary)
+    _write_ranked_susps(all_statements, dstar_ins.evaluate_batch(
+        p + p_slice, f + f_slice, 0, tf * 2), h1_rank_list_file, binary)
+    _write_ranked_susps(all_statements, dstar_ins.evaluate_batch(
+        p + p_mt + p_slice, f + f_mt + f_slice, 0, tf * 2 + tf_mt),
+                        h2_rank_list_file, binary)
 
 
 def generate_spectrum_based_rank_lists(rank_lists_dir, base_name, statements,
                                        pass_map, fail_map, total_passed,
-                                       total_failed, *, formula_list=None):
+                                       total_failed, *, formula_list=None,
+                                       inputs=None, binary=False):
+    # if `inputs` is given, a manifest of inputs is recorded for every rank
+    # list, see stale_spectrum_based_formulas
+    # drop duplicated statements and statements never covered by failed tests
+    statements = [s for s in dict.fromkeys(statements) if fail_map[s] != 0]
+    passed, failed = _map_to_array(pass_map, statements), \
+                     _map_to_array(fail_map, statements)
     for formula, ins in _FORMULA_MAPS.items():
         if formula_list and formula not in formula_list:
             continue
         rank_list_file = join(rank_lists_dir, base_name + '.' + formula)
-        # if exists(rank_list_file):
-        #     continue
-        susp_map = {}
-        for s in statements:
-            if fail_map[s] == 0:
-                continue
-            s_str = s[0] + '#' + str(s[1])
-            susp_map[s_str] = ins.evaluate(
-                pass_map[s], fail_map[s], total_passed, total_failed)
-        ranked_susp_list = sorted(susp_map.items(), key=lambda kv: kv[1],
-                                  reverse=True)
-        write_rank_list(ranked_susp_list, rank_list_file)
+        susps = ins.evaluate_batch(passed, failed, total_passed, total_failed)
+        _write_ranked_susps(statements, susps, rank_list_file, binary)
+        if inputs:
+            write_manifest(rank_list_file,
+                           _spectrum_based_manifest(formula, inputs, binary))
+
+
+def _spectrum_based_manifest(formula, inputs, binary):
+    import analysis.rankfile
+    # only the code of the formula itself is recorded, so that editing one
+    # formula recomputes the rank lists of that formula only
+    return build_manifest(inputs, code=(
+        type(_FORMULA_MAPS[formula]), generate_spectrum_based_rank_lists,
+        _write_ranked_susps, analysis.rankfile), params={'binary': binary})
+
+
+def stale_spectrum_based_formulas(rank_lists_dir, base_name, inputs, *,
+                                  binary=False):
+    return [
+        formula for formula in _FORMULA_MAPS
+        if not is_up_to_date(join(rank_lists_dir, base_name + '.' + formula),
+                             _spectrum_based_manifest(formula, inputs, binary))
+    ]
+
+
+_TYPE_PATTERN = re.compile(r'[\w.$]+')
+_TYPE_MESSAGE_PATTERN = re.compile(
+    r'(?P<first_line>.*?) at [\w.$]+\([^)]*\.java:\d+\)')
+_TYPE_MESSAGE_LOCATION_PATTERN = re.compile(
+    r'(?P<first_line>.*?) at (?P<location>[\w.$]+\([^)]*\.java:\d+\))')
 
 
 def distill_type(trace):
-    m = re.match(r'[\w.$]+', trace)
+    m = _TYPE_PATTERN.match(trace)
     return m.group() if m else trace
 
 
 def distill_type_message(trace):
-    m = re.match(r'(?P<first_line>.*?) at [\w.$]+\([^)]*\.java:\d+\)', trace)
+    m = _TYPE_MESSAGE_PATTERN.match(trace)
     return m.group('first_line') if m else trace
 
 
 def distill_type_message_location(trace):
-    m = re.match(
-        r'(?P<first_line>.*?) at (?P<location>[\w.$]+\([^)]*\.java:\d+\))',
-        trace)
+    m = _TYPE_MESSAGE_LOCATION_PATTERN.match(trace)
     return m.group('first_line', 'location') if m else trace
 
 
@@ -259,134 +341,202 @@ def distill_equal(tr1, tr2, distill_func):
     return distill_func(tr1) == distill_func(tr2)
 
 
-def get_mutation_info(data_dir, mutants_dir, original_test_report, results_dir):
-    from analysis import read_relevant_test_report
-    # collect mutation test information from mutation test result files
-    mutation_logs = _read_mutation_logs(join(mutants_dir, 'mutation.log'))
-    mutated_stmts = [(_get_outer_most_class(l[1]), int(l[3])) for l in
-                     mutation_logs] if mutation_logs else []
-    p2f_count, f2p_count, f2f_count = 0, 0, 0
-    p2f_before_map, f2p_except_mutated_map = {}, {}
-    f2p_mutated_map, f2f_except_mutated_map = {}, {}
-    f2f_mutated_map = {}
-    f2f_distill_type_mutated_map = {}
-    f2f_distill_message_mutated_map = {}
-    f2f_distill_location_mutated_map = {}
-    f2f_distill_exact_mutated_map = {}
-    for mutant_id, mutated_stmt in enumerate(mutated_stmts):
-        mutant_test_report = read_relevant_test_report(
-            results_dir, mutant_id, timeout_as_fail=False)
-        if not mutant_test_report:
-            continue
-        for test_case, result in mutant_test_report.items():
-            if test_case not in original_test_report:
+def _fingerprint(distilled):
+    # a hash stable across processes, a distilled (first line, location)
+    # pair never equals a distilled string
+    if isinstance(distilled, tuple):
+        distilled = '\1' + '\0'.join(distilled)
+    return int.from_bytes(hashlib.blake2b(
+        distilled.encode(errors='surrogatepass'), digest_size=8).digest(),
+        'little')
+
+
+def failure_fingerprints(trace):
+    # fingerprints of a failure by distill_type, distill_type_message,
+    # distill_type_message_location and the exact trace, two failures are
+    # equal by a distiller if their fingerprints of it are
+    return (_fingerprint(distill_type(trace)),
+            _fingerprint(distill_type_message(trace)),
+            _fingerprint(distill_type_message_location(trace)),
+            _fingerprint(trace))
+
+
+def failure_fingerprints_digest():
+    # digest of the code computing failure_fingerprints, fingerprints kept
+    # across runs are only valid while it is unchanged
+    patterns = '\0'.join(p.pattern for p in (
+        _TYPE_PATTERN, _TYPE_MESSAGE_PATTERN, _TYPE_MESSAGE_LOCATION_PATTERN))
+    return hashlib.sha1((code_digest(
+        distill_type, distill_type_message, distill_type_message_location,
+        _fingerprint, failure_fingerprints) + patterns).encode()).hexdigest()
+
+
+# mutants are split into this many shards per worker, so that workers
+# finishing early take over the remaining shards
+_SHARDS_PER_JOB = 4
+
+# kinds of mutant test outcomes whose traces or slices are read
+_P2F, _F2P, _F2F = 0, 1, 2
+
+
+def _mutation_trace_shard(data_dir, events, dir_index, interner):
+    # partial counts of the traces of mutant test outcomes [(kind, mutant_id,
+    # test_case, mutated_id)...], the maps are kept as arrays of statement ids
+    # of `interner`, one id per count
+    # many mutants leave identical traces of a test, parsed once here
+    store = TraceStore(interner)
+    counts = Counter()
+    f2f_except_mutated_ids, f2p_except_mutated_ids = [], []
+    p2f_before_ids = []
+    for kind, mutant_id, test_case, mutated_id in events:
+        if kind == _P2F:
+            p2f_before_file = join(
+                data_dir, 'trace', str(mutant_id), test_case + '.b')
+            if not dir_index.exists(p2f_before_file):
+                continue
+            ids_in_trace = store.read_ids(p2f_before_file, ',')
+            counts['p2f'] += 1
+            p2f_before_ids.append(ids_in_trace)
+        elif kind == _F2P:
+            f2p_file = join(data_dir, 'trace', str(mutant_id), test_case)
+            if not dir_index.exists(f2p_file):
                 continue
-            original_result = original_test_report[test_case]
-            if original_result[0] and not result[0]:
-                p2f_before_file = join(
-                    data_dir, 'trace', str(mutant_id), test_case + '.b')
-                if not exists(p2f_before_file):
-                    continue
-                statements_in_trace = [
-                    _standardize_statement(l.rstrip('\n').split(',')[0])
-                    for l in
-                    open(p2f_before_file).readlines()
-                ]
-                p2f_count += 1
-                for s in statements_in_trace:
-                    if s not in p2f_before_map:
-                        p2f_before_map[s] = 0
-                    p2f_before_map[s] += 1
-            elif not original_result[0] and result[0]:
-                if mutated_stmt not in f2p_mutated_map:
-                    f2p_mutated_map[mutated_stmt] = 0
-                f2p_mutated_map[mutated_stmt] += 1
-
-                f2p_file = join(data_dir, 'trace', str(mutant_id), test_case)
-                if not exists(f2p_file):
-                    continue
-                statements_in_trace = [
-                    _standardize_statement(l.rstrip('\n').split(',')[0])
-                    for l in
-                    open(f2p_file).readlines()
-                ]
-                f2p_count += 1
-                for s in statements_in_trace:
-                    if s == mutated_stmt:
-                        continue
-                    if s not in f2p_except_mutated_map:
-                        f2p_except_mutated_map[s] = 0
-                    f2p_except_mutated_map[s] += 1
-            elif not original_result[0] and not result[0]:
-                f2f_count += 1
-                if mutated_stmt not in f2f_mutated_map:
-                    f2f_mutated_map[mutated_stmt] = 0
-                f2f_mutated_map[mutated_stmt] += 1
-                if distill_equal(original_result[1], result[1],
-                                 distill_type):
-                    if mutated_stmt not in f2f_distill_type_mutated_map:
-                        f2f_distill_type_mutated_map[mutated_stmt] = 0
-                    f2f_distill_type_mutated_map[mutated_stmt] += 1
-                if distill_equal(original_result[1], result[1],
-                                 distill_type_message):
-                    if mutated_stmt not in f2f_distill_message_mutated_map:
-                        f2f_distill_message_mutated_map[mutated_stmt] = 0
-                    f2f_distill_message_mutated_map[mutated_stmt] += 1
-                if distill_equal(original_result[1], result[1],
-                                 distill_type_message_location):
-                    if mutated_stmt not in f2f_distill_location_mutated_map:
-                        f2f_distill_location_mutated_map[mutated_stmt] = 0
-                    f2f_distill_location_mutated_map[mutated_stmt] += 1
-                if original_result[1] == result[1]:
-                    if mutated_stmt not in f2f_distill_exact_mutated_map:
-                        f2f_distill_exact_mutated_map[mutated_stmt] = 0
-                    f2f_distill_exact_mutated_map[mutated_stmt] += 1
-                    f2f_slice_file = join(data_dir, 'slice', str(mutant_id),
-                                          test_case)
-                    if not exists(f2f_slice_file):
-                        continue
-                    statements_in_slice = [
-                        _standardize_statement(l.rstrip('\n'))
-                        for l in
-                        open(f2f_slice_file).readlines()
-                    ]
-                    for s in statements_in_slice:
-                        if s == mutated_stmt:
-                            continue
-                        if s not in f2f_except_mutated_map:
-                            f2f_except_mutated_map[s] = 0
-                        f2f_except_mutated_map[s] += 1
-    return f2f_except_mutated_map, f2p_count, f2p_except_mutated_map, \
-           f2p_mutated_map, p2f_before_map, p2f_count, f2f_count, \
+            ids_in_trace = store.read_ids(f2p_file, ',')
+            counts['f2p'] += 1
+            f2p_except_mutated_ids.append(
+                ids_in_trace[ids_in_trace != mutated_id])
+        else:
+            f2f_slice_file = join(data_dir, 'slice', str(mutant_id),
+                                  test_case)
+            if not dir_index.exists(f2f_slice_file):
+                continue
+            ids_in_slice = store.read_ids(f2f_slice_file)
+            f2f_except_mutated_ids.append(
+                ids_in_slice[ids_in_slice != mutated_id])
+    id_lists = [f2f_except_mutated_ids, f2p_except_mutated_ids,
+                p2f_before_ids]
+    return counts, interner.statements, [
+        np.concatenate(ids).astype(np.int64) if ids else
+        np.zeros(0, dtype=np.int64) for ids in id_lists]
+
+
+def _original_outcomes(original_test_report, test_reports):
+    # outcomes of the original tests by test id of test_reports, 1 if passed,
+    # 0 if failed and -1 if not run, with the fingerprints of the failures
+    test_ids = [test_reports.test_id(t) for t in original_test_report]
+    n_tests = len(test_reports.tests)
+    original_passed = np.full(n_tests, -1, dtype=np.int8)
+    original_fingerprints = np.zeros((n_tests, 4), dtype=np.uint64)
+    for test_id, result in zip(test_ids, original_test_report.values()):
+        original_passed[test_id] = result[0]
+        if not result[0]:
+            original_fingerprints[test_id] = result[2] if len(result) > 2 \
+                else failure_fingerprints(result[1])
+    return original_passed, original_fingerprints
+
+
+def get_mutation_info(data_dir, mutants_dir, original_test_report, results_dir,
+                      *, dir_index=None, jobs=1, interner=None,
+                      test_reports=None, mutations=None):
+    # collect mutation test information from mutation test result files
+    if dir_index is None:
+        dir_index = DirectoryIndex()
+    if interner is None:
+        interner = StatementInterner(standardize=_standardize_statement)
+    if mutations is None:
+        mutations = read_mutation_store(mutants_dir)
+    mutated_ids = mutations.statement_ids(interner, _get_outer_most_class)
+    # the test outcomes of all mutants in rows, the reports are parsed, or
+    # taken from the cache, at once
+    if test_reports is None:
+        test_reports = TestReports(results_dir)
+    outcomes = mutations.outcomes(test_reports)
+    cause_fingerprints = test_reports.cause_fingerprints
+    test_reports.save()
+    original_passed, original_fingerprints = _original_outcomes(
+        original_test_report, test_reports)
+
+    # classify all rows at once, timeouts are not taken as failures and tests
+    # not run on the original program are left out
+    original = original_passed[outcomes.test_ids]
+    passed = outcomes.outcome_ids == test_reports.outcome_id('PASS')
+    valid = (outcomes.outcome_ids != test_reports.outcome_id('TIMEOUT')) & \
+            (original >= 0)
+    p2f = valid & (original == 1) & ~passed
+    f2p = valid & (original == 0) & passed
+    f2f = valid & (original == 0) & ~passed
+    mutated = mutated_ids[outcomes.mutants]
+    # equal failures by each distiller, see failure_fingerprints
+    f2f_equal = cause_fingerprints[outcomes.cause_ids[f2f]] == \
+                original_fingerprints[outcomes.test_ids[f2f]]
+    f2f_exact = f2f.copy()
+    f2f_exact[f2f] = f2f_equal[:, 3]
+
+    # only the traces and slices of the outcomes are left to read, map shards
+    # of consecutive rows to partial counts on `jobs` workers, and reduce
+    # them in row order, so that the maps list statements in the order they
+    # are first counted, as a serial pass does
+    rows = np.flatnonzero(p2f | f2p | f2f_exact)
+    kinds = np.where(p2f[rows], _P2F, np.where(f2p[rows], _F2P, _F2F))
+    events = list(zip(kinds.tolist(), outcomes.mutants[rows].tolist(),
+                      [test_reports.tests[t] for t in
+                       outcomes.test_ids[rows].tolist()],
+                      mutated[rows].tolist()))
+    n_shards = 1 if jobs == 1 else (jobs or cpu_count()) * _SHARDS_PER_JOB
+    shard_size = max(1, -(-len(events) // n_shards))
+    tasks = [(data_dir, events[i:i + shard_size], dir_index, interner)
+             for i in range(0, len(events), shard_size)]
+    shard_indices = {id(task): i for i, task in enumerate(tasks)}
+    shard_results = [None] * len(tasks)
+    for task, succeeded, result in \
+            run_tasks(_mutation_trace_shard, tasks, jobs=jobs):
+        if not succeeded:
+            raise RuntimeError('failed to collect mutation info:\n%s' % result)
+        shard_results[shard_indices[id(task)]] = result
+    # shards interned statements on their own, translate their ids first
+    counts, id_lists = Counter(), [[] for _ in range(3)]
+    for shard_counts, shard_statements, shard_ids in shard_results:
+        counts.update(shard_counts)
+        remap = interner.remap(shard_statements)
+        for ids, ids_of_shard in zip(id_lists, shard_ids):
+            ids.append(remap[ids_of_shard])
+    f2f_except_mutated_map, f2p_except_mutated_map, p2f_before_map = \
+        map(interner.count_map, id_lists)
+    f2f_mutated = mutated[f2f]
+    f2p_mutated_map, f2f_mutated_map, f2f_distill_type_mutated_map, \
+    f2f_distill_message_mutated_map, f2f_distill_location_mutated_map, \
+    f2f_distill_exact_mutated_map = (interner.count_map([ids]) for ids in (
+        mutated[f2p], f2f_mutated, f2f_mutated[f2f_equal[:, 0]],
+        f2f_mutated[f2f_equal[:, 1]], f2f_mutated[f2f_equal[:, 2]],
+        f2f_mutated[f2f_equal[:, 3]]))
+    return f2f_except_mutated_map, counts['f2p'], f2p_except_mutated_map, \
+           f2p_mutated_map, p2f_before_map, counts['p2f'], int(f2f.sum()), \
            f2f_mutated_map, f2f_distill_type_mutated_map, \
            f2f_distill_message_mutated_map, f2f_distill_location_mutated_map, \
            f2f_distill_exact_mutated_map
 
 
-def get_slice_info(data_dir, original_test_report, results_dir):
+def get_slice_info(data_dir, original_test_report, results_dir, *,
+                   dir_index=None, interner=None):
     # collect slice information from slice files
-    slice_passed_map, slice_failed_map = {}, {}
+    if dir_index is None:
+        dir_index = DirectoryIndex()
+    if interner is None:
+        interner = StatementInterner(standardize=_standardize_statement)
+    store = TraceStore(interner)
+    slice_passed_ids, slice_failed_ids = [], []
     slice_total_passed, slice_total_failed = 0, 0
     for test_case, result in original_test_report.items():
         slice_file = join(data_dir, 'slice', 'origin', test_case)
-        if not exists(slice_file):
+        if not dir_index.exists(slice_file):
             continue
-        statements_in_slice = [
-            _standardize_statement(l.rstrip('\n'))
-            for l in
-            open(slice_file).readlines()]
+        ids_in_slice = store.read_ids(slice_file)
         if result[0]:
             slice_total_passed += 1
-            for s in statements_in_slice:
-                if s not in slice_passed_map:
-                    slice_passed_map[s] = 0
-                slice_passed_map[s] += 1
+            slice_passed_ids.append(ids_in_slice)
         else:
             slice_total_failed += 1
-            for s in statements_in_slice:
-                if s not in slice_failed_map:
-                    slice_failed_map[s] = 0
-                slice_failed_map[s] += 1
+            slice_failed_ids.append(ids_in_slice)
     # for some failed test, there might be assertions that were satisfied,
     # the slice with these criterion would be treat as passed slice.
     for test_case, result in original_test_report.items():
@@ -395,10 +545,10 @@ def get_slice_info(data_dir, original_test_report, results_dir):
         criterion_file = join(
             results_dir, 'origin', 'slice-criterion', test_case)
         failed_criterion = None
-        if exists(criterion_file):
+        if dir_index.exists(criterion_file):
             failed_criterion = open(criterion_file).read()
         assert_loc_file = join(results_dir, 'origin', 'asserts', test_case)
-        if not exists(assert_loc_file):
+        if not dir_index.exists(assert_loc_file):
             continue
         slice_criterion_list = [
             l.rstrip('\n').replace('::', '.').replace('#', ':') + ':*'
@@ -410,35 +560,35 @@ def get_slice_info(data_dir, original_test_report, results_dir):
                 continue
             slice_file = join(
                 data_dir, 'slice', 'origin', test_case + '.' + str(idx))
-            if exists(slice_file):
+            if dir_index.exists(slice_file):
                 slice_total_passed += 1
-                statements_in_slice = [
-                    _standardize_statement(l.rstrip('\n'))
-                    for l in
-                    open(slice_file).readlines()]
-                for s in statements_in_slice:
-                    if s not in slice_passed_map:
-                        slice_passed_map[s] = 0
-                    slice_passed_map[s] += 1
-    return slice_failed_map, slice_passed_map, slice_total_failed, \
+                slice_passed_ids.append(store.read_ids(slice_file))
+    return interner.count_map(slice_failed_ids), \
+           interner.count_map(slice_passed_ids), slice_total_failed, \
            slice_total_passed
 
 
-def get_spectrum_info(coverage_matrix, original_test_report, statements, tests):
+def aggregate_spectrum_counts(statements, passed, failed):
     pass_map = dict([(s, 0) for s in statements])
     fail_map = dict([(s, 0) for s in statements])
-    # collect spectrum information from gzoltar result files
-    pass_set, fail_set = set(), set()
-    for i, (test_case, is_passed) in enumerate(tests):
-        if is_passed:
-            pass_set.add(i)
-        else:
-            fail_set.add(i)
-    total_passed, total_failed = len(pass_set), len(fail_set)
-    for i in pass_set:
-        for s, covered in zip(statements, coverage_matrix[i]):
-            pass_map[s] += covered
-    for i in fail_set:
-        for s, covered in zip(statements, coverage_matrix[i]):
-            fail_map[s] += covered
+    # several gzoltar statements may be standardized to the same statement
+    for s, p, f in zip(statements, passed.tolist(), failed.tolist()):
+        pass_map[s] += p
+        fail_map[s] += f
+    return fail_map, pass_map
+
+
+def get_spectrum_info(coverage_matrix, original_test_report, statements, tests):
+    # collect spectrum information from gzoltar result files, tests may be
+    # given as [(test case, is passed)...] or as a boolean vector
+    if isinstance(tests, np.ndarray):
+        outcomes = tests
+    else:
+        outcomes = [is_passed for _, is_passed in tests]
+    if len(outcomes) == 0:
+        return dict([(s, 0) for s in statements]), \
+               dict([(s, 0) for s in statements]), 0, 0
+    passed, failed, total_passed, total_failed = count_spectrum(
+        coverage_matrix, outcomes)
+    fail_map, pass_map = aggregate_spectrum_counts(statements, passed, failed)
     return fail_map, pass_map, total_failed, total_passed
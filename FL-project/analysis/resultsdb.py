@@ -0,0 +1,149 @@
+import sys
+from os import listdir
+from os.path import join, basename
+
+from peewee import SqliteDatabase, Model, CharField, IntegerField, \
+    BlobField, Tuple
+
+from analysis.rankfile import read_rank_list, rank_list_to_bytes, \
+    rank_list_from_bytes
+
+# rank lists are inserted this many at a time
+_INSERT_BATCH_SIZE = 100
+
+
+class _RankListRecord(Model):
+    # a rank list of bug `project`-`bug_id` by `formula`, kept in the binary
+    # rank list format
+    project = CharField()
+    bug_id = IntegerField()
+    formula = CharField()
+    size = IntegerField()
+    data = BlobField()
+
+    class Meta:
+        table_name = 'rank_list'
+        indexes = (
+            (('project', 'bug_id', 'formula'), True),
+            (('formula', 'project', 'bug_id'), False),
+        )
+
+
+_MODELS = [_RankListRecord]
+
+
+def _connect(db_file):
+    db = SqliteDatabase(db_file, pragmas={'journal_mode': 'wal'})
+    db.bind(_MODELS)
+    db.connect()
+    db.create_tables(_MODELS)
+    return db
+
+
+def rank_list_key(name):
+    # 'Lang-1.ochiai' -> ('Lang', 1, 'ochiai')
+    pb, formula = basename(name).split('.', maxsplit=1)
+    project, bug_id = pb.split('-')
+    return project, int(bug_id), formula
+
+
+def store_rank_lists(db_file, rank_lists):
+    # store [(project, bug_id, formula, rank list)...] in a single
+    # transaction, replacing the stored ones of the same keys
+    db = _connect(db_file)
+    try:
+        with db.atomic():
+            rows = []
+            for project, bug_id, formula, rank_list in rank_lists:
+                rows.append((project, bug_id, formula, len(rank_list),
+                             rank_list_to_bytes(rank_list)))
+                if len(rows) >= _INSERT_BATCH_SIZE:
+                    _insert_rows(rows)
+                    rows = []
+            _insert_rows(rows)
+    finally:
+        db.close()
+
+
+def _insert_rows(rows):
+    if not rows:
+        return
+    _RankListRecord.insert_many(rows, fields=[
+        _RankListRecord.project, _RankListRecord.bug_id,
+        _RankListRecord.formula, _RankListRecord.size, _RankListRecord.data,
+    ]).on_conflict_replace().execute()
+
+
+def store_rank_list_files(db_file, rank_list_files):
+    store_rank_lists(db_file, (rank_list_key(f) + (read_rank_list(f),)
+                               for f in rank_list_files))
+
+
+def _filter(query, projects, formulas, bugs, exclude_projects):
+    conditions = []
+    if projects is not None:
+        conditions.append(_RankListRecord.project.in_(list(projects)))
+    if exclude_projects:
+        conditions.append(
+            _RankListRecord.project.not_in(list(exclude_projects)))
+    if formulas is not None:
+        conditions.append(_RankListRecord.formula.in_(list(formulas)))
+    if bugs is not None:
+        conditions.append(
+            Tuple(_RankListRecord.project, _RankListRecord.bug_id)
+            .in_([tuple(b) for b in bugs]))
+    return query.where(*conditions) if conditions else query
+
+
+def query_formulas(db_file, *, projects=None, bugs=None,
+                   exclude_projects=None):
+    db = _connect(db_file)
+    try:
+        query = _RankListRecord.select(_RankListRecord.formula).distinct()
+        query = _filter(query, projects, None, bugs, exclude_projects)
+        return sorted(f for f, in query.tuples())
+    finally:
+        db.close()
+
+
+def query_rank_list_keys(db_file, *, projects=None, formulas=None, bugs=None,
+                         exclude_projects=None):
+    # (project, bug_id, formula) of the stored rank lists, without reading
+    # the rank lists themselves
+    db = _connect(db_file)
+    try:
+        query = _RankListRecord.select(
+            _RankListRecord.project, _RankListRecord.bug_id,
+            _RankListRecord.formula)
+        query = _filter(query, projects, formulas, bugs, exclude_projects)
+        query = query.order_by(_RankListRecord.formula,
+                               _RankListRecord.project, _RankListRecord.bug_id)
+        return list(query.tuples())
+    finally:
+        db.close()
+
+
+def query_rank_lists(db_file, *, projects=None, formulas=None, bugs=None,
+                     exclude_projects=None):
+    # yield (project, bug_id, formula, rank list) of the stored rank lists,
+    # bugs are [(project, bug_id)...]
+    db = _connect(db_file)
+    try:
+        query = _RankListRecord.select(
+            _RankListRecord.project, _RankListRecord.bug_id,
+            _RankListRecord.formula, _RankListRecord.data)
+        query = _filter(query, projects, formulas, bugs, exclude_projects)
+        query = query.order_by(_RankListRecord.formula,
+                               _RankListRecord.project, _RankListRecord.bug_id)
+        for project, bug_id, formula, data in query.tuples().iterator():
+            yield project, bug_id, formula, rank_list_from_bytes(data)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    # python -m analysis.resultsdb results-db rank-lists-dir...
+    for rank_lists_dir in sys.argv[2:]:
+        store_rank_list_files(sys.argv[1], [
+            join(rank_lists_dir, f) for f in listdir(rank_lists_dir)
+            if '-' in f and not f.startswith('.')])
@@ -106,7 +106,8 @@ def transform_and_write_rank_list(args, graph_name, pb_id, stmt_pairs,
     res_susps_list = transform_rank_list(stmt_susps_list, stmt_pairs)
     logger.info('write result rank list for {}', pb_id)
     output_file = '%s.%s-%s' % (pb_id, args.method_name, graph_name)
-    write_rank_list(res_susps_list, join(args.output_dir, output_file))
+    write_rank_list(res_susps_list, join(args.output_dir, output_file),
+                    binary=getattr(args, 'binary', False))
 
 
 _FEATURE_TOP_N = 3
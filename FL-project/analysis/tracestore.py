@@ -0,0 +1,84 @@
+import hashlib
+import sys
+from os import walk, stat, fstat, link, replace, remove
+from os.path import join, exists
+
+from loguru import logger
+
+
+def _content_digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def _decode(data):
+    # as reading in text mode does, with universal newlines
+    text = data.decode()
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+class TraceStore:
+    # content addressed reader of trace and slice files. Every file is hashed
+    # once, files of the same content are parsed once into statement ids of
+    # `interner`, and hard links made by dedup_files are recognized by their
+    # inode without reading them again
+    def __init__(self, interner):
+        self.interner = interner
+        self._inode_digests = {}
+        self._ids = {}
+
+    def read_ids(self, file, separator=None):
+        # statement ids of a file, the array is shared by files of the same
+        # content and must not be modified
+        with open(file, 'rb') as f:
+            # the inode is taken from the open file, without another stat
+            st = fstat(f.fileno())
+            inode = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+            digest = self._inode_digests.get(inode)
+            if digest is None or (digest, separator) not in self._ids:
+                data = f.read()
+                digest = self._inode_digests[inode] = _content_digest(data)
+                if (digest, separator) not in self._ids:
+                    self._ids[digest, separator] = self.interner.ids_of_text(
+                        _decode(data), separator)
+        return self._ids[digest, separator]
+
+
+def dedup_files(directory):
+    # replace files of the same content under directory with hard links to
+    # one copy, return the number of bytes freed
+    by_size = {}
+    for root, _, files in walk(directory):
+        for f in files:
+            path = join(root, f)
+            by_size.setdefault(stat(path).st_size, []).append(path)
+    freed = 0
+    for size, paths in by_size.items():
+        if len(paths) < 2:
+            continue
+        by_digest = {}
+        for path in sorted(paths):
+            with open(path, 'rb') as f:
+                by_digest.setdefault(_content_digest(f.read()), []).append(path)
+        for same_paths in by_digest.values():
+            first = same_paths[0]
+            first_st = stat(first)
+            for path in same_paths[1:]:
+                st = stat(path)
+                if (st.st_dev, st.st_ino) == (first_st.st_dev,
+                                              first_st.st_ino):
+                    continue
+                tmp = path + '.dedup'
+                if exists(tmp):
+                    remove(tmp)
+                link(first, tmp)
+                replace(tmp, path)
+                freed += size
+    return freed
+
+
+if __name__ == '__main__':
+    # python -m analysis.tracestore data-dir/trace data-dir/slice...
+    for d in sys.argv[1:]:
+        logger.info('freed {} bytes under {}', dedup_files(d), d)
@@ -0,0 +1,6 @@
+import sys
+from os.path import dirname, realpath
+
+# tests import the analysis and localize packages next to this file, however
+# pytest is invoked
+sys.path.insert(0, dirname(realpath(__file__)))
@@ -0,0 +1,102 @@
+from os.path import join, exists
+
+import numpy as np
+
+from localize.testreport import _intern
+
+_LOG_FILE_NAME = 'mutation.log'
+
+
+def parse_mutation_log(text):
+    # [[id, class, method, line number, instruction number, details]...]
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return [l.split(',') for l in lines]
+
+
+def read_mutation_log_file(mutation_log_file):
+    if not exists(mutation_log_file):
+        return None
+    with open(mutation_log_file) as f:
+        return parse_mutation_log(f.read())
+
+
+class MutantOutcomes:
+    # test outcomes of the mutants of a store in rows, ordered by mutant and
+    # by test within the report of a mutant, ids as of TestReports
+    def __init__(self, mutants, test_ids, outcome_ids, cause_ids):
+        self.mutants = mutants
+        self.test_ids = test_ids
+        self.outcome_ids = outcome_ids
+        self.cause_ids = cause_ids
+
+    def __len__(self):
+        return len(self.mutants)
+
+
+class MutationStore:
+    # mutants of a bug in columns, mutant i is the i-th entry of the mutation
+    # log, with classes, methods and operators (e.g. AOR of AOR:1) interned
+    def __init__(self, classes, methods, operators, ids, class_ids,
+                 method_ids, lines, instructions, operator_ids):
+        self.classes = classes
+        self.methods = methods
+        self.operators = operators
+        # id of the mutant in the log
+        self.ids = ids
+        self.class_ids = class_ids
+        self.method_ids = method_ids
+        self.lines = lines
+        self.instructions = instructions
+        self.operator_ids = operator_ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def from_logs(logs):
+        classes, methods, operators = [], [], []
+        class_ids, method_ids, operator_ids = {}, {}, {}
+        columns = [[] for _ in range(6)]
+        for l in logs:
+            operator = l[5].split(':', maxsplit=1)[0] if len(l) > 5 else ''
+            for column, value in zip(columns, (
+                    int(l[0]), _intern(classes, class_ids, l[1]),
+                    _intern(methods, method_ids, l[2]), int(l[3]), int(l[4]),
+                    _intern(operators, operator_ids, operator))):
+                column.append(value)
+        ids, *id_columns = (np.array(c, dtype=np.int32) for c in columns)
+        return MutationStore(classes, methods, operators, ids, *id_columns)
+
+    def statement_ids(self, interner, standardize_class):
+        # ids of the mutated statements (standardize_class(class), line) of
+        # the mutants in `interner`, classes are standardized once each
+        classes = [standardize_class(c) for c in self.classes]
+        return np.fromiter(
+            (interner.intern((classes[c], l)) for c, l in
+             zip(self.class_ids.tolist(), self.lines.tolist())),
+            dtype=np.int64, count=len(self))
+
+    def outcomes(self, test_reports):
+        # join the mutants with their test reports, mutants without a report
+        # have no rows
+        test_reports.load(range(len(self)))
+        parts = []
+        for mutant_id in range(len(self)):
+            report = test_reports.report(mutant_id)
+            if not report:
+                continue
+            parts.append((np.full(len(report), mutant_id, dtype=np.int32),
+                          report.test_ids, report.outcome_ids,
+                          report.cause_ids))
+        if not parts:
+            return MutantOutcomes(*(np.zeros(0, dtype=np.int32)
+                                    for _ in range(4)))
+        return MutantOutcomes(*map(np.concatenate, zip(*parts)))
+
+
+def read_mutation_store(mutants_dir):
+    # an empty store if the mutants were not generated
+    logs = read_mutation_log_file(join(mutants_dir, _LOG_FILE_NAME))
+    return MutationStore.from_logs(logs or [])
@@ -0,0 +1,238 @@
+from functools import lru_cache
+from os import stat
+from os.path import join
+
+import numpy as np
+from loguru import logger
+
+from analysis.cachedir import load_cache_meta, write_cache
+
+_REPORT_FILE_NAME = 'relevant-tests.report'
+_CACHE_DIR_NAME = '.report-cache'
+_CACHE_VERSION = 2
+
+
+def report_dir_name(mutant_id=None):
+    # mutant 0 is taken as no mutant, i.e. the original program
+    return str(mutant_id) if mutant_id else 'origin'
+
+
+def parse_test_report(text):
+    # {test case: (outcome,) or (outcome, cause)}, the cause of a failure or
+    # timeout is the lines following it up to the first blank line, and the
+    # last report of a test case wins
+    report_map = {}
+    lines = text.split('\n')
+    i, n = 0, len(lines)
+    while i < n:
+        line = lines[i]
+        i += 1
+        if not line.startswith('--- '):
+            continue
+        test_case, if_pass = line[4:].split(',', maxsplit=1)
+        if if_pass == 'PASS':
+            report_map[test_case] = (if_pass,)
+            continue
+        start = i
+        while i < n and lines[i]:
+            i += 1
+        report_map[test_case] = (if_pass, '\n'.join(lines[start:i]))
+        i += 1
+    return report_map
+
+
+def _intern(table, ids, value):
+    i = ids.get(value)
+    if i is None:
+        i = ids[value] = len(table)
+        table.append(value)
+    return i
+
+
+@lru_cache(maxsize=None)
+def _fingerprints_digest():
+    from analysis.ranklist import failure_fingerprints_digest
+    return failure_fingerprints_digest()
+
+
+class TestReport:
+    # a relevant test report in columns, cause id is -1 for passed tests
+    def __init__(self, test_ids, outcome_ids, cause_ids):
+        self.test_ids = test_ids
+        self.outcome_ids = outcome_ids
+        self.cause_ids = cause_ids
+
+    def __len__(self):
+        return len(self.test_ids)
+
+
+class TestReports:
+    # relevant test reports of the origin and the mutants of a bug, with test
+    # cases, outcomes and causes interned across the reports. Parsed reports
+    # are cached under results_dir and reparsed once the size or mtime of
+    # their file changed, the causes are only read from the cache on use
+    def __init__(self, results_dir):
+        self.results_dir = results_dir
+        self._cache_dir = join(results_dir, _CACHE_DIR_NAME)
+        self._reset()
+        try:
+            self._load_cache()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning('broken test report cache {}: {}',
+                           self._cache_dir, e)
+            self._reset()
+
+    def _reset(self):
+        self.tests, self.outcomes = [], []
+        self._test_ids, self._outcome_ids = {}, {}
+        # the first _cached_causes causes are still in the cache
+        self._causes, self._cause_ids = [], None
+        self._cached_causes = 0
+        self._cause_fingerprints = np.zeros((0, 4), dtype=np.uint64)
+        # report dir name -> (signature, test ids, outcome ids, cause ids),
+        # columns are None if there is no report
+        self._reports = {}
+        self._changed = False
+
+    @property
+    def causes(self):
+        if self._cached_causes:
+            # the cached causes precede those parsed since
+            with open(join(self._cache_dir, 'causes')) as f:
+                text = f.read()
+            offsets = np.load(join(self._cache_dir, 'cause_offsets.npy'))
+            self._causes = [text[offsets[i]:offsets[i + 1]] for i in
+                            range(self._cached_causes)] + self._causes
+            self._cached_causes = 0
+        return self._causes
+
+    @property
+    def cause_fingerprints(self):
+        # analysis.ranklist.failure_fingerprints of every cause
+        from analysis.ranklist import failure_fingerprints
+        n = len(self._cause_fingerprints)
+        if n < self._n_causes():
+            self._cause_fingerprints = np.concatenate([
+                self._cause_fingerprints,
+                np.array([failure_fingerprints(c) for c in self.causes[n:]],
+                         dtype=np.uint64).reshape(-1, 4)])
+            self._changed = True
+        return self._cause_fingerprints
+
+    def _n_causes(self):
+        return self._cached_causes + len(self._causes)
+
+    def test_id(self, test_case):
+        return _intern(self.tests, self._test_ids, test_case)
+
+    def outcome_id(self, outcome):
+        return self._outcome_ids.get(outcome, -1)
+
+    def _cause_id(self, cause):
+        if self._cause_ids is None:
+            self._cause_ids = {c: i for i, c in enumerate(self.causes)}
+        return _intern(self.causes, self._cause_ids, cause)
+
+    def _parse(self, file):
+        with open(file) as f:
+            report_map = parse_test_report(f.read())
+        test_ids = np.array([self.test_id(t) for t in report_map],
+                            dtype=np.int32)
+        outcome_ids = np.array(
+            [_intern(self.outcomes, self._outcome_ids, r[0])
+             for r in report_map.values()], dtype=np.int32)
+        cause_ids = np.array(
+            [self._cause_id(r[1]) if len(r) > 1 else -1
+             for r in report_map.values()], dtype=np.int32)
+        return test_ids, outcome_ids, cause_ids
+
+    def load(self, mutant_ids):
+        # bring the reports of the mutants, None for the original program,
+        # up to date with their files
+        for mutant_id in mutant_ids:
+            name = report_dir_name(mutant_id)
+            file = join(self.results_dir, name, _REPORT_FILE_NAME)
+            try:
+                st = stat(file)
+                signature = [st.st_size, st.st_mtime_ns]
+            except FileNotFoundError:
+                signature = None
+            if name in self._reports and \
+                    self._reports[name][0] == signature:
+                continue
+            columns = self._parse(file) if signature else (None, None, None)
+            self._reports[name] = (signature,) + columns
+            self._changed = True
+
+    def report(self, mutant_id=None):
+        # the report of a mutant, None if there is none
+        name = report_dir_name(mutant_id)
+        if name not in self._reports:
+            self.load([mutant_id])
+        _, test_ids, outcome_ids, cause_ids = self._reports[name]
+        if test_ids is None:
+            return None
+        return TestReport(test_ids, outcome_ids, cause_ids)
+
+    def _load_cache(self):
+        meta = load_cache_meta(self._cache_dir, _CACHE_VERSION)
+        if not meta:
+            return
+        with open(join(self._cache_dir, 'tests')) as f:
+            self.tests = f.read().split('\n')[:meta['tests']]
+        self._test_ids = {t: i for i, t in enumerate(self.tests)}
+        self.outcomes = meta['outcomes']
+        self._outcome_ids = {o: i for i, o in enumerate(self.outcomes)}
+        self._cached_causes = meta['causes']
+        # fingerprints by other distillers are computed again on use
+        if meta['fingerprints'] == _fingerprints_digest():
+            self._cause_fingerprints = np.load(
+                join(self._cache_dir, 'cause_fingerprints.npy'))
+        columns = np.load(join(self._cache_dir, 'columns.npy'))
+        ranges = np.load(join(self._cache_dir, 'ranges.npy'))
+        for (name, signature), (start, end) in zip(meta['reports'],
+                                                   ranges.tolist()):
+            if start < 0:
+                self._reports[name] = (signature, None, None, None)
+                continue
+            test_ids, outcome_ids, cause_ids = columns[:, start:end]
+            self._reports[name] = (signature, test_ids, outcome_ids, cause_ids)
+
+    def save(self):
+        # write the cache if any report was parsed
+        if not self._changed:
+            return
+        try:
+            self._write_cache()
+            self._changed = False
+        except OSError as e:
+            logger.warning('failed to write test report cache {}: {}',
+                           self._cache_dir, e)
+
+    def _write_cache(self):
+        cause_fingerprints = self.cause_fingerprints
+        causes = self.causes
+        reports = sorted(self._reports.items())
+        ranges, columns, n = [], [], 0
+        for _, (_, test_ids, outcome_ids, cause_ids) in reports:
+            if test_ids is None:
+                ranges.append((-1, -1))
+                continue
+            ranges.append((n, n + len(test_ids)))
+            columns.append(np.stack([test_ids, outcome_ids, cause_ids]))
+            n += len(test_ids)
+        write_cache(self._cache_dir, {
+            'version': _CACHE_VERSION,
+            'tests': len(self.tests),
+            'outcomes': self.outcomes,
+            'causes': len(causes),
+            'fingerprints': _fingerprints_digest(),
+            'reports': [[name, r[0]] for name, r in reports],
+        }, arrays={
+            'ranges': np.array(ranges, dtype=np.int64).reshape(-1, 2),
+            'columns': np.concatenate(columns, axis=1) if columns else
+            np.zeros((3, 0), dtype=np.int32),
+            'cause_fingerprints': cause_fingerprints,
+            'cause_offsets': np.cumsum([0] + [len(c) for c in causes],
+                                       dtype=np.int64),
+        }, texts={'causes': ''.join(causes), 'tests': '\n'.join(self.tests)})
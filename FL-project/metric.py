@@ -3,7 +3,9 @@ from os import listdir
 from os.path import join
 import argparse
 
-from analysis.metrics import report_metrics, create_pretty_table
+from analysis.metrics import report_metrics, create_pretty_table, \
+    collect_all_statistics
+from analysis.resultsdb import query_rank_list_keys
 
 
 def _extract_project_bug_id_formula(name):
@@ -12,6 +14,46 @@ def _extract_project_bug_id_formula(name):
     return p, int(b), f
 
 
+def _query_rank_lists(args, bug_list):
+    # filter by indexed columns of the results database, and list the keys
+    # of the rank lists only, the rank lists are queried bug by bug by the
+    # workers of collect_all_statistics
+    bugs = None
+    if bug_list is not None:
+        bugs = [(b.split('-')[0], int(b.split('-')[1])) for b in bug_list
+                if '-' in b]
+    exclude_projects = [args.exclude] if args.exclude else None
+    formula_rank_lists = {}
+    for p, b, formula in query_rank_list_keys(
+            args.rank_list_dir, bugs=bugs, exclude_projects=exclude_projects):
+        if args.method and not formula.endswith(args.method):
+            continue
+        formula_rank_lists.setdefault(formula, []).append((p, b, None))
+    for formula in sorted(formula_rank_lists):
+        yield formula, formula_rank_lists[formula]
+
+
+def _list_rank_lists(args, bug_list):
+    rank_list_files = [
+        (_extract_project_bug_id_formula(f), join(args.rank_list_dir, f))
+        for f in listdir(args.rank_list_dir)
+        if '-' in f and (not args.exclude or args.exclude not in f)
+           and (not args.method or f.endswith(args.method))
+    ]
+
+    if bug_list is not None:
+        rank_list_files = list(filter(
+            lambda x: '%s-%s' % (x[0][0], x[0][1]) in bug_list,
+            rank_list_files))
+
+    formula_rank_list_files = {}
+    for (p, b, f), rank_list_file in rank_list_files:
+        formula_rank_list_files.setdefault(f, []).append(
+            (p, b, rank_list_file))
+    for formula in sorted(formula_rank_list_files):
+        yield formula, formula_rank_list_files[formula]
+
+
 def main(argc, argv):
     parser = argparse.ArgumentParser()
     parser.add_argument('rank_list_dir')
@@ -24,6 +66,12 @@ def main(argc, argv):
     parser.add_argument('-l', '--bug_list')
     parser.add_argument('-mm', '--method_map_dir')
     parser.add_argument('--csv', metavar='output result to csv')
+    parser.add_argument('--db', action='store_true', default=False,
+                        help='rank_list_dir is a results database')
+    parser.add_argument('-j', metavar='jobs', dest='jobs', type=int,
+                        default=None)
+    parser.add_argument('--streaming', action='store_true', default=False,
+                        help='stop reading a rank list after the first fault')
     args = parser.parse_args(argv[1:])
     method_map_dir = args.method_map_dir
 
@@ -31,32 +79,40 @@ def main(argc, argv):
         print('--csv is work only with --m')
         sys.exit(-1)
 
-    rank_list_files = [
-        (_extract_project_bug_id_formula(f), join(args.rank_list_dir, f))
-        for f in listdir(args.rank_list_dir)
-        if '-' in f and (not args.exclude or args.exclude not in f)
-           and (not args.method or f.endswith(args.method))
-    ]
-
+    bug_list = None
     if args.bug_list:
         bug_list = set([x.strip() for x in open(args.bug_list)])
-        rank_list_files = list(filter(
-            lambda x: '%s-%s' % (x[0][0], x[0][1]) in bug_list,
-            rank_list_files))
+
+    if args.db:
+        formula_rank_lists = _query_rank_lists(args, bug_list)
+    else:
+        formula_rank_lists = _list_rank_lists(args, bug_list)
+    # only keys and file names are listed here
+    formula_rank_lists = list(formula_rank_lists)
+
+    # every rank list is evaluated once on a pool of workers, and the
+    # statistics are reduced formula by formula below
+    statistics = collect_all_statistics(
+        [(p, b, formula, rank_list_file)
+         for formula, rl_files in formula_rank_lists
+         for p, b, rank_list_file in rl_files],
+        method_map_dir=method_map_dir, jobs=args.jobs,
+        streaming=args.streaming,
+        results_db=args.rank_list_dir if args.db else None)
 
     prt_table = None
     if args.show_table:
         prt_table = create_pretty_table()
 
-    for formula in sorted(set([x[0][2] for x in rank_list_files])):
-        rl_files = [(x[0][0], x[0][1], x[1]) for x in rank_list_files if
-                    x[0][2] == formula]
+    for formula, rl_files in formula_rank_lists:
         if not args.show_table:
             report_metrics(formula, rl_files, method_map_dir=method_map_dir,
+                           statistics=statistics.get(formula),
                            show_top_bugs=args.show_top_bugs,
                            output_csv=args.csv)
         else:
             report_metrics(formula, rl_files, method_map_dir=method_map_dir,
+                           statistics=statistics.get(formula),
                            show_top_bugs=args.show_top_bugs,
                            prt_table=prt_table)
     if args.show_table:
@@ -1,30 +1,50 @@
-import multiprocessing as mp
 import sys
 import argparse
 from os import listdir, makedirs
-from os.path import join
+from os.path import join, exists, getsize
 
 from loguru import logger
 
 from analysis.ranklist import generate_rank_lists, \
-    generate_spectrum_based_rank_lists, generate_hybrid_rank_lists
+    generate_spectrum_based_rank_lists, generate_hybrid_rank_lists, \
+    stale_spectrum_based_formulas
+from analysis.parallel import run_tasks
+from analysis.resultsdb import store_rank_list_files
 from abstract_featurelist import read_factor_list
 
 
-def _chunks(l, n):
-    for i in range(0, len(l), n):
-        yield l[i:i + n]
+def _generate_rank_list(data_dir, project, bug_id, rank_lists_dir,
+                        coverage_format, incremental, binary, mutation_jobs):
+    logger.info('rank list for {}-{}', project, bug_id)
+    project_bug_id = '%s-%d' % (project, bug_id)
+    pb_results_dir = join(data_dir, project_bug_id, 'results')
+    pb_data_dir = join(data_dir, project_bug_id, 'data')
+    pb_mutants_dir = join(data_dir, project_bug_id, 'mutants')
+    generate_rank_lists(pb_results_dir, pb_data_dir, pb_mutants_dir,
+                        project, bug_id, rank_lists_dir,
+                        coverage_format=coverage_format,
+                        incremental=incremental, binary=binary,
+                        mutation_jobs=mutation_jobs)
 
 
-def _generate_rank_lists(data_dir, project_bug_ids, rank_lists_dir):
-    for project, bug_id in project_bug_ids:
-        logger.info('rank list for {}-{}', project, bug_id)
-        project_bug_id = '%s-%d' % (project, bug_id)
-        pb_results_dir = join(data_dir, project_bug_id, 'results')
-        pb_data_dir = join(data_dir, project_bug_id, 'data')
-        pb_mutants_dir = join(data_dir, project_bug_id, 'mutants')
-        generate_rank_lists(pb_results_dir, pb_data_dir, pb_mutants_dir,
-                            project, bug_id, rank_lists_dir)
+def _bug_size(data_dir, project, bug_id):
+    # estimate the cost of a bug by its coverage matrix, or by its sloc
+    matrix_file = join(data_dir, '%s-%d' % (project, bug_id), 'results',
+                       'origin', 'gzoltar', 'matrix')
+    if exists(matrix_file):
+        return getsize(matrix_file)
+    from analysis.metrics import get_sloc_map
+    return get_sloc_map().get((project, bug_id), (0, 0))[0]
+
+
+def _store_rank_lists(results_db, rank_lists_dir, project_bug_ids):
+    # store the rank lists of the bugs into the results database at once
+    project_bug_ids = set(project_bug_ids)
+    rank_list_files = [join(rank_lists_dir, f) for f in listdir(rank_lists_dir)
+                       if f.split('.')[0] in project_bug_ids]
+    store_rank_list_files(results_db, rank_list_files)
+    logger.info('stored {} rank lists into {}', len(rank_list_files),
+                results_db)
 
 
 def main(argv):
@@ -34,6 +54,20 @@ def main(argv):
     parser.add_argument('-d', metavar='top-data-dir', dest='top_data_dir')
     parser.add_argument('-o', required=True,
                         metavar='rank-lists-dir', dest='rank_lists_dir')
+    parser.add_argument('-c', '--cache', action='store_const', const='cached',
+                        dest='coverage_format', default='packed')
+    parser.add_argument('--sparse', action='store_const', const='sparse',
+                        dest='coverage_format')
+    parser.add_argument('-j', metavar='jobs', dest='jobs', type=int,
+                        default=None)
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        default=False)
+    parser.add_argument('-b', '--binary', action='store_true', default=False)
+    parser.add_argument('--db', metavar='results-db', dest='results_db')
+    # mutants of a bug are analyzed by this many processes, of each of the
+    # -j processes, which helps when a few bugs have most of the mutants
+    parser.add_argument('-mj', metavar='mutation-jobs', dest='mutation_jobs',
+                        type=int, default=1)
     args = parser.parse_args(argv[1:])
     factor_lists_dir = args.factor_lists_dir
     data_dir = args.top_data_dir
@@ -45,16 +79,31 @@ def main(argv):
             x for x in listdir(factor_lists_dir) if x.endswith('.factors')
         ]
         for factors_file in factor_list_files:
+            base_name = factors_file.rsplit('.', 1)[0]
+            inputs, formula_list = None, None
+            if args.incremental:
+                inputs = [join(factor_lists_dir, factors_file)]
+                formula_list = stale_spectrum_based_formulas(
+                    rank_lists_dir, base_name, inputs, binary=args.binary)
+                if not formula_list:
+                    logger.info('rank lists for {} are up to date', base_name)
+                    continue
+
             (pass_map, fail_map, total_passed, total_failed, *_) = \
                 read_factor_list(join(factor_lists_dir, factors_file))
-            base_name = factors_file.rsplit('.', 1)[0]
 
             logger.info('rank list for {}', base_name)
 
             statements = pass_map.keys()
             generate_spectrum_based_rank_lists(rank_lists_dir, base_name,
                                                statements, pass_map, fail_map,
-                                               total_passed, total_failed)
+                                               total_passed, total_failed,
+                                               formula_list=formula_list,
+                                               inputs=inputs,
+                                               binary=args.binary)
+        if args.results_db:
+            _store_rank_lists(args.results_db, rank_lists_dir, [
+                x.rsplit('.', 1)[0] for x in factor_list_files])
         return
 
     # from 'data' dir
@@ -66,19 +115,30 @@ def main(argv):
         for x in
         listdir(data_dir) if '-' in x
     ]
-    core_num = 4
-    processes = []
-
     project_bug_ids = [(x[0], int(x[1])) for x in project_bug_ids]
-    for chunk in _chunks(project_bug_ids,
-                         len(project_bug_ids) // core_num + 1):
-        p = mp.Process(target=_generate_rank_lists,
-                       args=(data_dir, chunk, rank_lists_dir))
-        p.start()
-        processes.append(p)
-    for p in processes:
-        p.join()
-    processes.clear()
+    # schedule the largest bugs first to minimize the makespan
+    project_bug_ids.sort(key=lambda x: _bug_size(data_dir, *x), reverse=True)
+    tasks = [(data_dir, project, bug_id, rank_lists_dir, args.coverage_format,
+              args.incremental, args.binary, args.mutation_jobs)
+             for project, bug_id in project_bug_ids]
+    failed_bugs = []
+    for (_, project, bug_id, *_), succeeded, result in \
+            run_tasks(_generate_rank_list, tasks, jobs=args.jobs):
+        if succeeded:
+            logger.info('done rank list for {}-{}', project, bug_id)
+        else:
+            logger.error('failed rank list for {}-{}:\n{}',
+                         project, bug_id, result)
+            failed_bugs.append('%s-%d' % (project, bug_id))
+    logger.info('rank lists: {} succeeded, {} failed',
+                len(tasks) - len(failed_bugs), len(failed_bugs))
+    if args.results_db:
+        _store_rank_lists(args.results_db, rank_lists_dir, [
+            '%s-%d' % (project, bug_id) for project, bug_id in project_bug_ids
+            if '%s-%d' % (project, bug_id) not in failed_bugs])
+    if failed_bugs:
+        logger.error('failed bugs: {}', ' '.join(sorted(failed_bugs)))
+        sys.exit(-1)
 
 
 if __name__ == '__main__':
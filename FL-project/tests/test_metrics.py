@@ -0,0 +1,20 @@
+from analysis.metrics import E_inspect, nCr
+
+
+def _E_inspect_by_sum(st, en, nf):
+    # the summation E_inspect was computed by before its closed form
+    expected = float(st)
+    n = en - st + 1
+    for k in range(1, n - nf + 1):
+        term = float(nCr(n - k - 1, nf - 1) * k) / nCr(n, nf)
+        expected += term
+    return expected
+
+
+def test_E_inspect_matches_summation():
+    for st in (1, 3, 17):
+        for en in range(st - 1, st + 60):
+            for nf in range(1, en - st + 4):
+                expected = _E_inspect_by_sum(st, en, nf)
+                assert abs(E_inspect(st, en, nf) - expected) <= \
+                       1e-9 * expected, (st, en, nf)
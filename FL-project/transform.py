@@ -3,15 +3,37 @@ import sys
 from os import listdir
 from os.path import join
 
+from loguru import logger
+
+from analysis.manifest import build_manifest, is_up_to_date, write_manifest
+import analysis.rankfile
+import analysis.static_analysis
+from analysis.rankfile import read_rank_list
+from analysis.resultsdb import store_rank_list_files
 from analysis.static_analysis import transform_and_write_rank_list
 
 
+def _output_file(args, graph_name, pb_id):
+    return join(args.output_dir,
+                '%s.%s-%s' % (pb_id, args.method_name, graph_name))
+
+
+def _transform_manifest(rank_list_file, graph_file, binary):
+    return build_manifest([rank_list_file, graph_file],
+                          code=(analysis.static_analysis, analysis.rankfile),
+                          params={'binary': binary})
+
+
 def main(argv):
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', '--stmt_graph_dir')
     parser.add_argument('-r', '--ranklist_dir')
     parser.add_argument('-m', '--method_name')
     parser.add_argument('-o', '--output_dir')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        default=False)
+    parser.add_argument('-b', '--binary', action='store_true', default=False)
+    parser.add_argument('--db', metavar='results-db', dest='results_db')
 
     args = parser.parse_args(argv[1:])
     stmt_graph_dir = args.stmt_graph_dir
@@ -19,19 +41,35 @@ def main(argv):
     method_name = args.method_name
 
     rank_files = [x for x in listdir(rank_list_dir) if method_name in x]
+    output_files = []
 
     for rk_file in rank_files:
-        rank_list = list(map(lambda x: (x[1], float(x[2])), [
-            l.rstrip('\n').split(' ') for l in
-            open(join(rank_list_dir, rk_file)).readlines()
-        ]))
         pb_id = rk_file.split('.')[0]
         graph_file = '%s.%s' % (pb_id, 'ddg')
+        manifest = None
+        if args.incremental:
+            manifest = _transform_manifest(join(rank_list_dir, rk_file),
+                                           join(stmt_graph_dir, graph_file),
+                                           args.binary)
+            if is_up_to_date(_output_file(args, 'ddg', pb_id), manifest):
+                logger.info('transformed rank list for {} is up to date',
+                            pb_id)
+                output_files.append(_output_file(args, 'ddg', pb_id))
+                continue
+        rank_list = [(s, susp) for _, s, susp in
+                     read_rank_list(join(rank_list_dir, rk_file)).rows()]
         ddg_pairs = set(
             tuple(l.rstrip('\n').split(',')) for l in
             open(join(stmt_graph_dir, graph_file)).readlines()
         )
         transform_and_write_rank_list(args, 'ddg', pb_id, ddg_pairs, rank_list)
+        if manifest:
+            write_manifest(_output_file(args, 'ddg', pb_id), manifest)
+        output_files.append(_output_file(args, 'ddg', pb_id))
+
+    if args.results_db:
+        # store the transformed rank lists into the results database at once
+        store_rank_list_files(args.results_db, output_files)
 
 
 if __name__ == '__main__':